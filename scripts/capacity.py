@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import copy
+import argparse
+
+from sweep import load_spec, DEFAULT_SEEDS, SRC_DIR
+
+sys.path.insert(0, SRC_DIR)
+from sim import simulate  # noqa: E402
+from util.statistics import mean_interval  # noqa: E402
+
+# Spec keys passed on to the simulations as they are
+SIM_OPTIONS = ['sim_time', 'engine', 'network_cores', 'deq_cost',
+               'queue_policy', 'cache_dir', 'histogram_backend', 'precision',
+               'warmup']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the highest load'
+                                     ' meeting the SLO of every flow by'
+                                     ' bisecting over a factor scaling the'
+                                     ' load of all the flows')
+    parser.add_argument('spec', help='Capacity search specification file')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                        help='Number of replications running at the same'
+                        ' time', default=1)
+    parser.add_argument('-o', '--output', dest='output', action='store',
+                        help='Also write the result to this JSON file',
+                        default=None)
+    opts = parser.parse_args()
+
+    spec = load_spec(opts.spec)
+    result = search_capacity(spec, opts.jobs)
+    print json.dumps(result, indent=2)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+def scaled_config(flows, scale):
+    config = copy.deepcopy(flows)
+    for flow in config:
+        flow['load'] = flow['load'] * scale
+    return config
+
+
+def run_seeds(spec, config, seeds, jobs):
+    # Array with the target percentile of every flow for every seed
+    options = dict((key, spec[key]) for key in SIM_OPTIONS if key in spec)
+    result = simulate(config, spec.get('host_type', 'global'),
+                      spec.get('cores', 8), list(seeds), jobs=jobs,
+                      **options)
+    percentile = spec.get('percentile', 99.0)
+    return [run.percentiles([percentile])[:, 0] for run in result.runs]
+
+
+def probe(spec, flows, scale, seeds, jobs):
+    """Decide whether every flow meets its SLO at a load scale. Replications
+    are added until the 95% confidence interval of the target percentile of
+    every flow is on one side of its SLO, or one flow is above it for sure,
+    or there are no seeds left, in which case the means decide. The probe is
+    certain when the intervals decided its verdict."""
+    config = scaled_config(flows, scale)
+    slos = [flow.get('slo') for flow in flows]
+    step = spec.get('min_replications', 3)
+    max_replications = min(spec.get('max_replications', 10), len(seeds))
+
+    samples = []
+    while True:
+        new_seeds = seeds[len(samples):min(len(samples) + step,
+                                           max_replications)]
+        samples += run_seeds(spec, config, new_seeds, jobs)
+
+        verdicts = []
+        for flow, slo in enumerate(slos):
+            if slo is None:
+                continue
+            mean, half_width = mean_interval([s[flow] for s in samples])
+            if mean + half_width <= slo:
+                verdict = True
+            elif mean - half_width > slo:
+                verdict = False
+            else:
+                verdict = None
+            verdicts.append({'flow': flow, 'mean': mean,
+                             'half_width': half_width, 'slo': slo,
+                             'meets_slo': verdict})
+
+        decided = [v['meets_slo'] for v in verdicts]
+        if (False in decided or None not in decided or
+                len(samples) >= max_replications):
+            break
+
+    # Undecided flows are judged on their mean
+    for v in verdicts:
+        if v['meets_slo'] is None:
+            v['certain'] = False
+            v['meets_slo'] = v['mean'] <= v['slo']
+        else:
+            v['certain'] = True
+    feasible = all(v['meets_slo'] for v in verdicts)
+    if feasible:
+        certain = all(v['certain'] for v in verdicts)
+    else:
+        certain = any(v['certain'] and not v['meets_slo'] for v in verdicts)
+    return {
+        'scale': scale,
+        'total_load': sum(flow['load'] for flow in config),
+        'replications': len(samples),
+        'flows': verdicts,
+        'feasible': feasible,
+        'certain': certain
+    }
+
+
+def search_capacity(spec, jobs=1):
+    flows = spec['flows']
+    if all(flow.get('slo') is None for flow in flows):
+        raise ValueError('No flow has an SLO')
+    seeds = spec.get('seeds', DEFAULT_SEEDS)
+    base_load = sum(flow['load'] for flow in flows)
+
+    # The system is assumed to meet the SLOs without load. Unless it still
+    # meets them at max_load, the bracket is halved until it is narrower
+    # than the tolerance (both in total load).
+    low = 0.0
+    high = spec.get('max_load', 1.0) / base_load
+    tolerance = spec.get('tolerance', 0.01) / base_load
+    probes = [probe(spec, flows, high, seeds, jobs)]
+    if probes[0]['feasible']:
+        low = high
+    while high - low > tolerance:
+        scale = (low + high) / 2
+        result = probe(spec, flows, scale, seeds, jobs)
+        probes.append(result)
+        if result['feasible']:
+            low = scale
+        else:
+            high = scale
+
+    # Flows missing their SLO at the lowest load found infeasible
+    failed = [p for p in probes if not p['feasible'] and p['scale'] == high]
+    limiting = []
+    if failed:
+        limiting = [v['flow'] for v in failed[0]['flows']
+                    if not v['meets_slo']]
+
+    # Confidence bounds on the capacity, from the probes decided by their
+    # intervals only: every flow surely met its SLO at the lower one and
+    # some flow surely missed it at the upper one
+    met = [p['scale'] for p in probes if p['certain'] and p['feasible']]
+    missed = [p['scale'] for p in probes
+              if p['certain'] and not p['feasible']]
+    return {
+        'capacity': low * base_load,
+        'lower_bound': max(met) * base_load if met else 0.0,
+        'upper_bound': min(missed) * base_load if missed else None,
+        'feasible_at_max_load': probes[0]['feasible'],
+        'scale': low,
+        'limiting_flows': limiting,
+        'certain': all(p['certain'] for p in probes),
+        'runs': sum(p['replications'] for p in probes),
+        'probes': probes
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,7 @@ def main():
     # Set the simulation parameters
     iterations = 10
     core_count = [1]
-    host_types = ['global']
+    host_types = ['ps']
     deq_costs = [0.0]
     queue_policies = ['placeholder']
 
@@ -39,8 +39,7 @@ def main():
         "inter_gen": "poisson_arrival",
         "mean": 1.0,
         "load": 0.9,
-        "time_slice": 0.1,
-        "preemption": 0.0,
+        "time_slice": 0.0,
         "enq_front": False
         }] 
 
@@ -18,7 +18,7 @@ def main():
     # Set the simulation parameters
     iterations = 10
     core_count = [1]
-    host_types = ['global']
+    host_types = ['ps']
     deq_costs = [0.0]
     queue_policies = ['placeholder']
 
@@ -40,8 +40,7 @@ def main():
         "mean": 1.0,
         "std_dev_request": 10.0,
         "load": 0.9,
-        "time_slice": 0.1,
-        "preemption": 0.0,
+        "time_slice": 0.0,
         "enq_front": False
         }] 
 
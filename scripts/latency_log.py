@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+from util.latency_log import (read_log, latency_cdf,  # noqa: E402
+                              latency_percentiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the binary latency'
+                                     ' log written by sim.py --print-values'
+                                     ' --log-format binary')
+    parser.add_argument('log', help='Latency log (<output-file>.lat)')
+    parser.add_argument('-f', '--flow', dest='flow', action='store',
+                        type=int, help='Flow to query', default=0)
+    parser.add_argument('-p', '--percentiles', dest='percentiles',
+                        action='store', type=float, nargs='+',
+                        help='Exact latency percentiles to print',
+                        default=[50, 90, 99, 99.9])
+    parser.add_argument('--cdf', dest='cdf', action='store', type=float,
+                        nargs='+', help='Print the fraction of requests with'
+                        ' a latency up to each of these values', default=None)
+    opts = parser.parse_args()
+
+    log = read_log(opts.log)
+    result = {
+        'requests': int((log['flow'] == opts.flow).sum()),
+        'percentiles': dict(('{:g}'.format(p), v) for p, v in zip(
+            opts.percentiles,
+            latency_percentiles(log, opts.flow, opts.percentiles)))
+    }
+    if opts.cdf:
+        result['cdf'] = dict(('{:g}'.format(v), f) for v, f in zip(
+            opts.cdf, latency_cdf(log, opts.flow, opts.cdf).tolist()))
+    print json.dumps(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+from util.histogram import merge_encoded, percentile_info  # noqa: E402
+from util.results_store import ResultsStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the histograms of'
+                                     ' several runs and print percentiles of'
+                                     ' the merged distribution')
+    parser.add_argument('inputs', nargs='+', help='Sweep results folders or'
+                        ' files with the output of sim.py --histograms')
+    parser.add_argument('-f', '--flow', dest='flow', action='store',
+                        type=int, help='Flow to merge', default=0)
+    parser.add_argument('-p', '--percentiles', dest='percentiles',
+                        action='store', type=float, nargs='+',
+                        help='Percentiles to print',
+                        default=[50, 90, 99, 99.9])
+    parser.add_argument('--where', dest='where', action='append',
+                        help='Only merge the sweep runs whose column has'
+                        ' the given value (column=value)', default=[])
+    parser.add_argument('--group-by', dest='group_by', action='store',
+                        help='Merge the sweep runs separately for every value'
+                        ' of this column', default=None)
+    opts = parser.parse_args()
+
+    groups = {}
+    for path in opts.inputs:
+        if os.path.isdir(path):
+            encodings = store_encodings(path, opts)
+        else:
+            encodings = {None: output_encodings(path, opts.flow)}
+        for group, group_encodings in encodings.items():
+            groups.setdefault(group, []).extend(group_encodings)
+
+    results = []
+    for group in sorted(groups.keys()):
+        info = percentile_info(merge_encoded(groups[group]),
+                               opts.percentiles)
+        info['runs'] = len(groups[group])
+        if opts.group_by is not None:
+            info[opts.group_by] = group
+        results.append(info)
+    print json.dumps(results)
+
+
+def parse_value(value):
+    if value in ('True', 'False'):
+        return value == 'True'
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def store_encodings(path, opts):
+    conditions = dict((c.split('=', 1)[0], parse_value(c.split('=', 1)[1]))
+                      for c in opts.where)
+    results = ResultsStore(os.path.join(path, 'results.npz')).query(
+        **conditions)
+    column = 'flow' + str(opts.flow) + '_histogram'
+    if column not in results:
+        sys.exit('No histograms in {}, the sweep spec needs "histograms":'
+                 ' true'.format(path))
+
+    groups = {}
+    for i, encoded in enumerate(results[column].tolist()):
+        if encoded == '':
+            continue
+        group = None
+        if opts.group_by is not None:
+            group = results[opts.group_by][i].item()
+        groups.setdefault(group, []).append(encoded)
+    return groups
+
+
+def output_encodings(path, flow):
+    # Either a single run or the per seed runs of sim.py --seeds
+    with open(path) as f:
+        output = json.load(f)
+    runs = output['runs'] if isinstance(output, dict) else [output]
+    return [str(run[flow]['histogram']) for run in runs]
+
+
+if __name__ == "__main__":
+    main()
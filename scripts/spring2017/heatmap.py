@@ -1,14 +1,38 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
 import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'src'))
+from util.results_store import ResultsStore  # noqa: E402
+
+if len(sys.argv) != 3:
+    print ("Usage: ./heatmap.py <perflow_results_folder>"
+           " <global_results_folder>")
+    sys.exit(1)
+
+
+def flow_latency(folder):
+    # Mean flow 0 latency over the seeds per core count and ratio of the
+    # configured flow means (the mean latencies are flow<k>_lat_mean)
+    results = ResultsStore(os.path.join(folder, 'results.npz')).load()
+    frame = pd.DataFrame({
+        'cores': results['cores'],
+        'ratio': np.round(results['flow1_mean'] / results['flow0_mean'], 6),
+        'latency': results['flow0_latency']
+    })
+    return frame.pivot_table(index='cores', columns='ratio',
+                             values='latency', aggfunc=np.mean)
+
+
 # Import data into panda dataframe
-latency_ratio = pd.read_csv("perflow_global_fcfs.csv",
-                            index_col='cores')
+latency_ratio = flow_latency(sys.argv[1]) / flow_latency(sys.argv[2])
 
 # Remove Index Title
 latency_ratio.index.name = "# cores"
@@ -1,31 +1,20 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import argparse
 
-results = []
-for line in sys.stdin:
-    results.append(line)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'src'))
+from util.results_store import ResultsStore, mean_by  # noqa: E402
 
-new_results = []
-new_results.append(results[3])   # 1 core
-new_results.append(results[6])   # 2 cores
-new_results.append(results[9])   # 3 cores
-new_results.append(results[10])  # 4 cores
-new_results.append(results[13])  # 5 cores
-new_results.append(results[14])  # 6 cores
-new_results.append(results[15])  # 7 cores
-new_results.append(results[17])  # 8 cores
-new_results.append(results[18])  # 9 cores
-new_results.append(results[2])   # 10 cores
-new_results.append(results[4])   # 15 cores
-new_results.append(results[5])   # 20 cores
-new_results.append(results[8])   # 25 cores
-new_results.append(results[12])  # 50 cores
-new_results.append(results[1])   # 100 cores
-new_results.append(results[7])   # 250 cores
-new_results.append(results[11])  # 500 cores
-new_results.append(results[16])  # 750 cores
-new_results.append(results[0])   # 1000 cores
+parser = argparse.ArgumentParser(description='Print the mean over the seeds'
+                                 ' of a result column in core count order')
+parser.add_argument('results', help='Results folder')
+parser.add_argument('--column', dest='column', action='store',
+                    help='Result column', default='flow0_latency')
+opts = parser.parse_args()
 
-for i in new_results:
-    print str(i[:-1])
+results = ResultsStore(os.path.join(opts.results, 'results.npz')).load()
+for cores, value in zip(*mean_by(results, 'cores', opts.column)):
+    print str(value)
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import copy
+import json
+import Queue
+import argparse
+import itertools
+import threading
+import subprocess
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'src')
+SIM_PATH = os.path.join(SRC_DIR, 'sim.py')
+
+sys.path.insert(0, SRC_DIR)
+from util.result_cache import ResultCache, run_key  # noqa: E402
+from util.results_store import ResultsStore  # noqa: E402
+from util.histogram import (merge_states, add_warmup,  # noqa: E402
+                            PERCENTILES)
+from util.statistics import mean_interval  # noqa: E402
+
+RESULTS_FILE = 'results.npz'
+
+DEFAULT_SEEDS = [497577696, 308484504, 976250624, 331509278, 373072862,
+                 494155711, 64603035, 414537690, 712438709, 566941566,
+                 356444130, 198904022, 906581464, 44964761, 931163827,
+                 797805274, 344646089, 387905473, 298058383, 664246766]
+
+# Flow parameters appended to the output names, in the order used by the
+# per experiment scripts
+WORK_GEN_FIELDS = ['mean', 'std_dev_request', 'exec_time', 'heavy_per',
+                   'heavy_time', 'std_dev_arrival', 'time_slice',
+                   'enq_front']
+APP_GEN_FIELDS = ['app_mean', 'std_dev_app', 'app_time', 'time_slice',
+                  'enq_front']
+
+# Summary statistics of the latencies stored as flow<k>_lat_<name> columns,
+# flow configurations have parameters of the same names
+LATENCY_STATS = ['count', 'mean', 'max', 'stddev']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a parameter sweep'
+                                     ' described by a JSON or YAML spec')
+    parser.add_argument('spec', help='Sweep specification file')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                        help='Number of simulations running at the same'
+                        ' time', default=multiprocessing.cpu_count())
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Only print the output names of the points',
+                        default=False)
+    parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+                        help='Result cache shared with sim.py, overrides the'
+                        ' cache_dir of the spec', default=None)
+    opts = parser.parse_args()
+
+    spec = load_spec(opts.spec)
+    points = sweep_points(spec)
+    if opts.dry_run:
+        for point in points:
+            print point['name']
+        return
+
+    if opts.cache_dir is not None:
+        spec['cache_dir'] = opts.cache_dir
+    run_sweep(spec, points, opts.jobs)
+
+
+def load_spec(path):
+    with open(path) as f:
+        if path.endswith('.yaml') or path.endswith('.yml'):
+            if yaml is None:
+                raise ImportError('PyYAML is needed to read ' + path)
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def flow_loads(spec):
+    # Every entry gives the load of each flow, None keeps the template load
+    num_flows = len(spec['flows'])
+    if spec.get('load_grid') is not None:
+        loads = [list(point) for point in
+                 itertools.product(*spec['load_grid'])]
+    else:
+        split = spec.get('load_split', [1.0] + [None] * (num_flows - 1))
+        total_loads = []
+        if spec.get('load_step') is not None:
+            # Multiples of a step computed like the per experiment scripts
+            # do, 0.05 * 3 is not the literal 0.15
+            step, start, stop = spec['load_step']
+            total_loads = [step * i for i in range(start, stop)]
+        loads = []
+        for load in total_loads + spec.get('loads', []):
+            if isinstance(load, list):
+                loads.append(load)
+            else:
+                loads.append([load * s if s is not None else None
+                              for s in split])
+
+    # Skip the points that overload the system
+    max_load = spec.get('max_load')
+    if max_load is not None:
+        loads = [point for point in loads
+                 if sum(l for l in point if l is not None) < max_load]
+    return loads
+
+
+def flow_configs(spec):
+    configs = []
+    for loads in flow_loads(spec):
+        config = copy.deepcopy(spec['flows'])
+        for flow, load in zip(config, loads):
+            if load is not None:
+                flow['load'] = load
+        configs.append(config)
+    return configs
+
+
+def output_name(output_dir, cores, host, deq_cost, queue_policy, config,
+                name_fields=None):
+    # Same names as the per experiment scripts so that the plotting scripts
+    # keep working
+    full_name = (output_dir + "sim_" + str(cores) + "_" + str(host) + "_" +
+                 str(deq_cost) + "_" + queue_policy)
+    for key in range(len(config)):
+        val = config[key]
+        if val.get("app_gen") is not None:
+            gen = val["app_gen"]
+            fields = APP_GEN_FIELDS
+        else:
+            gen = val["work_gen"]
+            fields = WORK_GEN_FIELDS
+        if name_fields is not None:
+            fields = name_fields
+
+        flow_name = ("_" + "flow" + str(key) + "_" + str(gen) +
+                     "_" + str(val["inter_gen"]) + "_" + str(val["load"]))
+        for field in fields:
+            if val.get(field) is None:
+                continue
+            if field == "enq_front":
+                flow_name += "_enqfront" + str(val[field])
+            else:
+                flow_name += "_" + str(val[field])
+
+        full_name += flow_name
+    return full_name
+
+
+def sweep_points(spec):
+    output_dir = spec['output_dir']
+    if not output_dir.endswith("/"):
+        output_dir += "/"
+
+    points = []
+    for deq_cost in spec.get('deq_costs', [0.0]):
+        for host in spec.get('host_types', ['global']):
+            for cores in spec['cores']:
+                for config in flow_configs(spec):
+                    for queue_policy in spec.get('queue_policies',
+                                                 ['FlowQueues']):
+                        points.append({
+                            'deq_cost': deq_cost,
+                            'host': host,
+                            'cores': cores,
+                            'config': config,
+                            'queue_policy': queue_policy,
+                            'name': output_name(output_dir, cores, host,
+                                                deq_cost, queue_policy,
+                                                config,
+                                                spec.get('name_fields'))
+                        })
+    return points
+
+
+def sim_args(spec, point):
+    # The flow configuration goes along with the arguments in the job
+    args = ["--cores", str(point['cores']),
+            "--host-type", str(point['host']),
+            "--deq-cost", str(point['deq_cost']),
+            "--queue-policy", point['queue_policy']]
+    if spec.get('histograms'):
+        args.append("--histograms")
+    args.append("--percentiles")
+    args.extend([str(p) for p in spec.get('percentiles', PERCENTILES)])
+    if spec.get('network_cores') is not None:
+        args.extend(["--network-cores", str(spec['network_cores'])])
+    if spec.get('sim_time') is not None:
+        args.extend(["--sim_time", str(spec['sim_time'])])
+    if spec.get('engine') is not None:
+        args.extend(["--engine", spec['engine']])
+    if spec.get('histogram_backend') is not None:
+        args.extend(["--histogram-backend", spec['histogram_backend']])
+    if spec.get('precision') is not None:
+        args.extend(["--precision", str(spec['precision'])])
+    if spec.get('sketch_size') is not None:
+        args.extend(["--sketch-size", str(spec['sketch_size'])])
+    if spec.get('warmup') is not None:
+        args.extend(["--warmup", str(spec['warmup'])])
+    if spec.get('target_ci') is not None:
+        args.extend(["--target-ci", str(spec['target_ci'])])
+        for key in ['target_percentile', 'batch_time', 'min_batches']:
+            if spec.get(key) is not None:
+                args.extend(["--" + key.replace('_', '-'), str(spec[key])])
+    if spec.get('cache_dir') is not None:
+        args.extend(["--cache-dir", spec['cache_dir']])
+        if spec.get('cache_size') is not None:
+            args.extend(["--cache-size", str(spec['cache_size'])])
+    return args
+
+
+def job_key(spec, point, seed):
+    # Same key as sim.py computes for the run
+    engine = spec.get('engine', 'simpy')
+    if engine == 'vector':
+        from engine.vector import vector_eligible
+        if not vector_eligible(point['host'], float(point['deq_cost']),
+                               point['config']):
+            engine = 'heap'
+    return run_key(point['config'], point['host'], point['cores'],
+                   spec.get('network_cores', 0), point['deq_cost'],
+                   point['queue_policy'], seed,
+                   spec.get('sim_time', 500000), engine,
+                   spec.get('histogram_backend', 'hdr'),
+                   spec.get('precision', 2), spec.get('sketch_size', 200),
+                   spec.get('warmup'))
+
+
+class Worker(object):
+    """sim.py --serve process running the jobs of one pool thread, so that
+    the simulator is only started once per thread."""
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, SIM_PATH, '--serve'],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def run(self, args, flow_config):
+        self.process.stdin.write(json.dumps({'args': args,
+                                             'flow_config': flow_config}) +
+                                 '\n')
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError('Simulation worker exited: ' + ' '.join(args))
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError('Simulation failed (' + response['error'] +
+                               '): ' + ' '.join(args))
+        return response['result']
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def make_run_job(workers):
+    local = threading.local()
+    lock = threading.Lock()
+
+    def run_job(job):
+        # Runs in one of the pool threads with the worker of the thread,
+        # errors are handed back with the job as apply_async drops them
+        point_idx, seed_idx, args, flow_config = job
+        try:
+            if not hasattr(local, 'worker'):
+                local.worker = Worker()
+                with lock:
+                    workers.append(local.worker)
+            return (point_idx, seed_idx,
+                    local.worker.run(args, flow_config), None)
+        except Exception as e:
+            return point_idx, seed_idx, None, e
+
+    return run_job
+
+
+def converged(spec, outputs):
+    # Whether the confidence interval of the metric of every flow is within
+    # replication_ci times its mean
+    target = spec.get('replication_ci')
+    if target is None:
+        return False
+    outputs = [output for output in outputs if output is not None]
+    metric = spec.get('replication_metric', 'latency')
+    for flow in range(len(outputs[0])):
+        mean, half_width = mean_interval([output[flow][metric]
+                                          for output in outputs])
+        if half_width > target * abs(mean):
+            return False
+    return True
+
+
+def run_sweep(spec, points, jobs):
+    output_dir = os.path.dirname(points[0]['name']) if points else None
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    store = ResultsStore(os.path.join(output_dir or '', RESULTS_FILE))
+
+    seeds = spec.get('seeds', DEFAULT_SEEDS)[:spec.get('iterations', 10)]
+
+    # With replication_ci a point starts with min_iterations seeds and gets
+    # one more at a time until its results are precise enough, iterations
+    # is then the budget of seeds of every point
+    initial = len(seeds)
+    if spec.get('replication_ci') is not None:
+        initial = min(spec.get('min_iterations', 3), len(seeds))
+
+    # Runs stopping on their own are never cached
+    cache = None
+    if spec.get('cache_dir') is not None and spec.get('target_ci') is None:
+        cache = ResultCache(spec['cache_dir'])
+
+    # The pool hands out the next job as soon as a simulation finishes and
+    # the finished runs come back through a queue
+    results = [[None] * len(seeds) for point in points]
+    rows = [[] for point in points]
+    submitted = [0 for point in points]
+    running = [0 for point in points]
+    finished = Queue.Queue()
+    pool = ThreadPool(max(1, jobs))
+    workers = []
+    run_job = make_run_job(workers)
+
+    def submit(point_idx):
+        # Next seed of a point, from the cache if it is there
+        point = points[point_idx]
+        seed_idx = submitted[point_idx]
+        seed = seeds[seed_idx]
+        submitted[point_idx] += 1
+        running[point_idx] += 1
+        if cache is not None:
+            cached = cache.get(job_key(spec, point, seed))
+            if cached is not None:
+                output = merge_states([cached['state']],
+                                      float(point['cores']),
+                                      bool(spec.get('histograms')),
+                                      spec.get('percentiles', PERCENTILES))
+                add_warmup(output, cached['state'])
+                finished.put((point_idx, seed_idx, output, None))
+                return
+        job = (point_idx, seed_idx, sim_args(spec, point) + ["-s", str(seed)],
+               point['config'])
+        pool.apply_async(run_job, (job,), callback=finished.put)
+
+    try:
+        for point_idx in range(len(points)):
+            for i in range(initial):
+                submit(point_idx)
+
+        while sum(running) != 0:
+            point_idx, seed_idx, output, error = finished.get()
+            running[point_idx] -= 1
+            if error is not None:
+                raise error
+            point = points[point_idx]
+            rows[point_idx].append(result_row(spec, point, seeds[seed_idx],
+                                              output))
+            results[point_idx][seed_idx] = output
+            if running[point_idx] != 0:
+                continue
+
+            if (submitted[point_idx] < len(seeds) and
+                    not converged(spec, results[point_idx])):
+                submit(point_idx)
+                continue
+
+            # Save the point as soon as it is done, so that a killed sweep
+            # only loses the points it was running
+            store.append(rows[point_idx])
+            rows[point_idx] = []
+            if spec.get('text_files'):
+                write_results(point, [output for output in results[point_idx]
+                                      if output is not None])
+    finally:
+        pool.close()
+        pool.join()
+        for worker in workers:
+            worker.close()
+
+        # Keep the runs that finished even if the sweep failed
+        store.append([row for point_rows in rows for row in point_rows])
+        store.compact()
+
+    print "Winding down"
+
+
+def result_row(spec, point, seed, output):
+    # One row per run, the flow parameters and results are flow<k>_ columns
+    row = {
+        'name': os.path.basename(point['name']),
+        'cores': int(point['cores']),
+        'host_type': point['host'],
+        'deq_cost': float(point['deq_cost']),
+        'queue_policy': point['queue_policy'],
+        'network_cores': int(spec.get('network_cores', 0)),
+        'sim_time': float(spec.get('sim_time', 500000)),
+        'seed': int(seed),
+        'num_flows': len(point['config']),
+        'total_load': sum(flow['load'] for flow in point['config'])
+    }
+    for i, flow in enumerate(point['config']):
+        prefix = 'flow' + str(i) + '_'
+        for name, value in flow.items():
+            row[prefix + name] = value
+        for name, value in output[i].items():
+            if name == 'percentiles':
+                for percentile, latency in value.items():
+                    row[prefix + 'p' + percentile] = latency
+                continue
+            if name in LATENCY_STATS:
+                name = 'lat_' + name
+            if prefix + name in row:
+                raise ValueError('Result {} of flow {} has the name of a flow'
+                                 ' parameter'.format(name, i))
+            row[prefix + name] = value
+    return row
+
+
+def write_values(name, values):
+    with open(name, 'w') as f:
+        for value in values:
+            f.write(str(value) + "\n")
+
+    with open(name + ".total", 'w') as f:
+        value = sum(values) * 1.0 / len(values)
+        f.write(str(value) + "\n")
+
+
+def write_results(point, outputs):
+    # Same text files as the per experiment scripts, one line per seed
+    for i in range(len(point['config'])):
+        flow_name = point['name'] + "_" + "flow" + str(i)
+        write_values(flow_name,
+                     [output[i]['latency'] for output in outputs])
+        write_values(flow_name + '.throughput',
+                     [output[i]['per_core_through'] for output in outputs])
+        write_values(flow_name + '.slo',
+                     [output[i]['slo_success'] for output in outputs])
+
+
+if __name__ == "__main__":
+    main()
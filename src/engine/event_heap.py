@@ -0,0 +1,182 @@
+from heapq import heappush, heappop
+from itertools import count
+import collections
+
+
+# Same priorities as simpy so that simultaneous events are processed in the
+# same order (process initialization before everything else)
+URGENT = 0
+NORMAL = 1
+
+PENDING = object()
+
+
+class Event(object):
+    __slots__ = ('env', 'callbacks', 'value')
+
+    def __init__(self, env):
+        self.env = env
+        self.callbacks = []
+        self.value = PENDING
+
+    def succeed(self, value=None):
+        self.value = value
+        self.env.schedule(self)
+        return self
+
+
+class Timeout(Event):
+    __slots__ = ()
+
+    def __init__(self, env, delay, value=None):
+        if delay < 0:
+            raise ValueError('Negative delay {}'.format(delay))
+        self.env = env
+        self.callbacks = []
+        self.value = value
+        env.schedule(self, NORMAL, delay)
+
+
+class Process(Event):
+    __slots__ = ('generator',)
+
+    def __init__(self, env, generator):
+        self.env = env
+        self.callbacks = []
+        self.value = PENDING
+        self.generator = generator
+
+        # Start the generator on the next step, before regular events
+        init = Event(env)
+        init.callbacks.append(self.resume)
+        init.value = None
+        env.schedule(init, URGENT)
+
+    def resume(self, event):
+        while True:
+            try:
+                event = self.generator.send(event.value)
+            except StopIteration:
+                self.value = None
+                self.env.schedule(self)
+                return
+
+            # Wait for the event unless it has already been processed
+            if event.callbacks is not None:
+                event.callbacks.append(self.resume)
+                return
+
+
+class Request(Event):
+    __slots__ = ()
+
+
+class Release(Event):
+    __slots__ = ('request',)
+
+
+class Resource(object):
+
+    def __init__(self, env, capacity=1):
+        self.env = env
+        self.capacity = capacity
+        self.users = []
+        self.queue = collections.deque()
+
+    def request(self):
+        request = Request(self.env)
+        self.queue.append(request)
+        self.trigger_request()
+        return request
+
+    def release(self, request):
+        release = Release(self.env)
+        release.request = request
+        try:
+            self.users.remove(request)
+        except ValueError:
+            pass
+        # Waiting requests are only granted once the release is processed
+        release.callbacks.append(self.trigger_request)
+        return release.succeed()
+
+    def trigger_request(self, event=None):
+        if len(self.queue) != 0 and len(self.users) < self.capacity:
+            request = self.queue.popleft()
+            self.users.append(request)
+            request.succeed()
+
+
+class Environment(object):
+    """Future event list kept in a binary heap of (time, priority, id,
+    callback, event) entries. It is a slimmed down simpy: the subset of the
+    simpy.Environment interface used by the hosts and schedulers, processing
+    simultaneous events in the same order as simpy so results are identical
+    for the same seed. The request generators and the cores with free
+    dequeues run as plain callbacks (call_soon, call_later) rather than
+    generator processes waiting on events."""
+
+    def __init__(self, initial_time=0):
+        self.now = initial_time
+        self.queue = []
+        self.eid = count()
+
+    def schedule(self, event, priority=NORMAL, delay=0):
+        heappush(self.queue, (self.now + delay, priority, next(self.eid),
+                              None, event))
+
+    def timeout(self, delay, value=None):
+        return Timeout(self, delay, value)
+
+    def process(self, generator):
+        return Process(self, generator)
+
+    def event(self):
+        return Event(self)
+
+    def resource(self, capacity=1):
+        return Resource(self, capacity)
+
+    # Plain callbacks taking the places of the events of a process in the
+    # event order, without a generator to resume
+
+    def call_soon(self, callback):
+        # Runs callback(None) at the current time before the regular
+        # events, where a new process would start
+        heappush(self.queue, (self.now, URGENT, next(self.eid), callback,
+                              None))
+
+    def call_later(self, delay, callback):
+        # Runs callback(None) where a timeout of delay would fire
+        if delay < 0:
+            raise ValueError('Negative delay {}'.format(delay))
+        heappush(self.queue, (self.now + delay, NORMAL, next(self.eid),
+                              callback, None))
+
+    def peek(self):
+        if len(self.queue) == 0:
+            return float('inf')
+        return self.queue[0][0]
+
+    def run(self, until=None):
+        queue = self.queue
+        if until is not None:
+            at = float(until)
+            if at <= self.now:
+                raise ValueError('until(={}) should be > the current'
+                                 ' simulation time'.format(at))
+            # A None entry marks the end of the simulation, it is scheduled
+            # before all the regular events happening at the same time
+            self.schedule(None, URGENT, at - self.now)
+
+        while len(queue) != 0:
+            self.now, _, _, callback, event = heappop(queue)
+            if callback is not None:
+                callback(None)
+                continue
+            if event is None:
+                return
+
+            callbacks, event.callbacks = event.callbacks, None
+            for callback in callbacks:
+                callback(event)
@@ -1,4 +1,5 @@
 import sys
+import heapq
 import logging
 from queue.request_queue import *
 from scheduler.scheduler import *
@@ -47,12 +48,27 @@ class CoreGroup(object):
             core.set_notifier(notifier)
 
 
-class GlobalQueueHost(object):
+class Host(object):
+
+    request_generator = None
+
+    def set_request_generator(self, request_generator):
+        self.request_generator = request_generator
+
+    def next_arrival(self):
+        # Without a generator a request may show up at any time
+        if self.request_generator is None:
+            return self.env.now
+        return self.request_generator.next_arrival()
+
+
+class GlobalQueueHost(Host):
 
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
 
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.core_group = CoreGroup()
         self.queue = FIFORequestQueue(env, -1, deq_cost, flow_config)
 
@@ -63,8 +79,9 @@ class GlobalQueueHost(object):
             self.core_group.append_idle_core(new_core)
 
     def receive_request(self, request):
-        logging.debug('Host: Received request %d from flow %d at %f' %
-                      (request.idx, request.flow_id, self.env.now))
+        if self.debug:
+            logging.debug('Host: Received request %d from flow %d at %f' %
+                          (request.idx, request.flow_id, self.env.now))
 
         self.queue.enqueue(request)
 
@@ -72,19 +89,20 @@ class GlobalQueueHost(object):
 
         activate_core = self.core_group.pop_one_idle_core()
         if activate_core:
-            self.env.process(activate_core.become_active())
+            activate_core.activate()
             self.core_group.append_active_core(activate_core)
 
     def core_become_idle(self, core, done_request):
         self.core_group.core_become_idle(core)
 
 
-class PartitionedGlobalQueueHost(object):
+class PartitionedGlobalQueueHost(Host):
 
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
 
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.app_core_group = CoreGroup()
         self.net_core_group = CoreGroup()
         self.net_queue = FIFORequestQueue(env, -1, deq_cost, flow_config)
@@ -104,20 +122,21 @@ class PartitionedGlobalQueueHost(object):
                 self.app_core_group.append_idle_core(new_core)
 
     def receive_request(self, request):
-        logging.debug('Host: Received request %d from flow %d at %f' %
-                      (request.idx, request.flow_id, self.env.now))
+        if self.debug:
+            logging.debug('Host: Received request %d from flow %d at %f' %
+                          (request.idx, request.flow_id, self.env.now))
 
         if request.network_time == 0.0:
             self.app_queue.enqueue(request)
             activate_core = self.app_core_group.pop_one_idle_core()
             if activate_core:
-                self.env.process(activate_core.become_active())
+                activate_core.activate()
                 self.app_core_group.append_active_core(activate_core)
         else:
             self.net_queue.enqueue(request)
             activate_core = self.net_core_group.pop_one_idle_core()
             if activate_core:
-                self.env.process(activate_core.become_active())
+                activate_core.activate()
                 self.net_core_group.append_active_core(activate_core)
 
     def core_become_idle(self, core, done_request, is_network):
@@ -127,12 +146,13 @@ class PartitionedGlobalQueueHost(object):
             self.app_core_group.core_become_idle(core)
 
 
-class MixedGlobalQueueHost(object):
+class MixedGlobalQueueHost(Host):
 
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
 
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.core_group = CoreGroup()
         self.queue = FIFORequestQueue(env, -1, deq_cost, flow_config)
 
@@ -143,8 +163,9 @@ class MixedGlobalQueueHost(object):
             self.core_group.append_idle_core(new_core)
 
     def receive_request(self, request):
-        logging.debug('Host: Received request %d from flow %d at %f' %
-                      (request.idx, request.flow_id, self.env.now))
+        if self.debug:
+            logging.debug('Host: Received request %d from flow %d at %f' %
+                          (request.idx, request.flow_id, self.env.now))
 
         self.queue.enqueue(request)
 
@@ -152,18 +173,19 @@ class MixedGlobalQueueHost(object):
 
         activate_core = self.core_group.pop_one_idle_core()
         if activate_core:
-            self.env.process(activate_core.become_active())
+            activate_core.activate()
             self.core_group.append_active_core(activate_core)
 
     def core_become_idle(self, core, done_request):
         self.core_group.core_become_idle(core)
 
 
-class MultiQueueHost(object):
+class MultiQueueHost(Host):
 
     def __init__(self, env, num_queues, histograms, deq_cost, flow_config,
                  opts):
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.queues = []
         self.cores = []
 
@@ -183,17 +205,18 @@ class MultiQueueHost(object):
 
         idx = self.load_balancer.queue_index_assign_to(request)
 
-        logging.debug('Host: Received request {} at {}, assigning to queue {}'
-                      .format(request.idx, self.env.now, idx))
+        if self.debug:
+            logging.debug('Host: Received request {} at {}, assigning to'
+                          ' queue {}'.format(request.idx, self.env.now, idx))
 
         self.queues[idx].enqueue(request)
-        self.env.process(self.cores[idx].become_active())
+        self.cores[idx].activate()
 
     def core_become_idle(self, core, done_request):
         pass
 
 
-class ShinjukuHost(object):
+class ShinjukuHost(Host):
 
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
@@ -226,10 +249,11 @@ class ShinjukuHost(object):
         self.env.process(self.shinjuku.become_active())
 
 
-class PerFlowQueueHost(object):
+class PerFlowQueueHost(Host):
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.core_group = CoreGroup()
         self.queues = None
 
@@ -256,8 +280,9 @@ class PerFlowQueueHost(object):
             self.core_group.append_idle_core(new_core)
 
     def receive_request(self, request):
-        logging.debug('Host: Received request %d from flow %d at %f' %
-                      (request.idx, request.flow_id, self.env.now))
+        if self.debug:
+            logging.debug('Host: Received request %d from flow %d at %f' %
+                          (request.idx, request.flow_id, self.env.now))
         if not self.queues.enqueue(request):
             self.histograms.drop_request(request.flow_id)
             return
@@ -265,18 +290,19 @@ class PerFlowQueueHost(object):
         # Putting active cores into list
         activate_core = self.core_group.pop_one_idle_core()
         if activate_core:
-            self.env.process(activate_core.become_active())
+            activate_core.activate()
             self.core_group.append_active_core(activate_core)
 
     def core_become_idle(self, core, done_request):
         self.core_group.core_become_idle(core)
 
 
-class StaticCoreAllocationHost(object):
+class StaticCoreAllocationHost(Host):
 
     def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
                  opts):
         self.env = env
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         self.core_groups = []
         self.queues = []
 
@@ -304,17 +330,81 @@ class StaticCoreAllocationHost(object):
             raise "Total number of cores not the same as num_cores in host.py"
 
     def receive_request(self, request):
-        logging.debug('Host: Received request %d from flow %d at %f' %
-                      (request.idx, request.flow_id, self.env.now))
+        if self.debug:
+            logging.debug('Host: Received request %d from flow %d at %f' %
+                          (request.idx, request.flow_id, self.env.now))
         self.queues[request.flow_id - 1].enqueue(request)
 
         # Put active cores into list
         activate_core = self.core_groups[request.flow_id].\
             pop_one_idle_core()
         if activate_core:
-            self.env.process(activate_core.become_active())
+            activate_core.activate()
             self.core_groups[request.flow_id].\
                 append_active_core(activate_core)
 
     def core_become_idle(self, core, done_request):
         self.core_groups[done_request.flow_id].core_become_idle(core)
+
+
+class ProcessorSharingHost(Host):
+    """Egalitarian processor sharing over num_cores cores: the n requests in
+    the system are each served at rate min(1, num_cores / n). All of them
+    attain service at the same pace, so a request finishes once the virtual
+    time (service attained by every request since the start) reaches its
+    finish tag. Only the next completion is scheduled."""
+
+    def __init__(self, env, num_cores, histograms, deq_cost, flow_config,
+                 opts):
+        self.env = env
+        self.num_cores = num_cores
+        self.histograms = histograms
+
+        self.virtual_time = 0.0
+        self.last_update = 0.0
+        # Heap of (finish tag, request index, request)
+        self.requests = []
+        self.completion = None
+
+    def rate(self):
+        return min(1.0, float(self.num_cores) / len(self.requests))
+
+    def advance(self):
+        if len(self.requests) != 0:
+            self.virtual_time += ((self.env.now - self.last_update) *
+                                  self.rate())
+        self.last_update = self.env.now
+
+    def schedule_completion(self):
+        # Any previously scheduled completion is superseded
+        if len(self.requests) == 0:
+            self.completion = None
+            return
+        delay = (self.requests[0][0] - self.virtual_time) / self.rate()
+        self.completion = self.env.timeout(max(delay, 0.0))
+        self.completion.callbacks.append(self.complete)
+
+    def receive_request(self, request):
+        logging.debug('PSHost: Received request %d from flow %d at %f' %
+                      (request.idx, request.flow_id, self.env.now))
+        self.advance()
+        finish_tag = (self.virtual_time + request.exec_time +
+                      request.network_time)
+        heapq.heappush(self.requests, (finish_tag, request.idx, request))
+        self.schedule_completion()
+
+    def complete(self, event):
+        if event is not self.completion:
+            return
+
+        self.advance()
+        # Avoid rounding leaving the head request with a tiny remainder
+        self.virtual_time = max(self.virtual_time, self.requests[0][0])
+        while (len(self.requests) != 0 and
+               self.requests[0][0] <= self.virtual_time):
+            _, _, request = heapq.heappop(self.requests)
+            latency = self.env.now - request.start_time
+            logging.debug('PSHost: Request {} Latency {}'.format(
+                request.idx, latency))
+            self.histograms.record_value(request.flow_id, latency, request)
+        self.schedule_completion()
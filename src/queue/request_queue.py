@@ -2,6 +2,14 @@ import simpy
 import logging
 import collections
 
+
+def queue_lock(env):
+    # The event heap engine provides its own resource implementation
+    if isinstance(env, simpy.Environment):
+        return simpy.Resource(env, capacity=1)
+    return env.resource(capacity=1)
+
+
 class RequestQueue(object):
 
     def __init__(self, env, size):
@@ -22,7 +30,7 @@ class FIFORequestQueue(RequestQueue):
         self.flow_config = flow_config
 
         # Assuming queue can only be accessed once at a time
-        self.resource = simpy.Resource(env, capacity=1)
+        self.resource = queue_lock(env)
 
     def enqueue(self, request):
         self.q.append(request)
@@ -125,10 +133,11 @@ class PerFlowRequestQueueGroup(RequestQueue):
 
     def __init__(self, env, dequeue_time, flow_config):
         super(PerFlowRequestQueueGroup, self).__init__(env, len(flow_config))
+        self.qs = []
         self.dequeue_time = dequeue_time
         self.flow_config = flow_config
         # Assuming queue can only be accessed once at a time
-        self.resource = simpy.Resource(env, capacity=1)
+        self.resource = queue_lock(env)
 
     def set_dequeue_policy(self, dqp):
         self.dequeue_policy = dqp
@@ -8,11 +8,17 @@ class InterArrivalGenerator(object):
     def next(self):
         return 1
 
+    def sample_block(self, n):
+        return np.ones(n)
+
 
 class PoissonArrivalGenerator(InterArrivalGenerator):
     def next(self):
         return np.random.exponential(self.mean)
 
+    def sample_block(self, n):
+        return np.random.exponential(self.mean, n)
+
 
 class LogNormalArrivalGenerator(InterArrivalGenerator):
     def __init__(self, mean, opts=None):
@@ -24,3 +30,6 @@ class LogNormalArrivalGenerator(InterArrivalGenerator):
 
     def next(self):
         return np.random.lognormal(self.mean, self.scale)
+
+    def sample_block(self, n):
+        return np.random.lognormal(self.mean, self.scale, n)
@@ -1,13 +1,6 @@
-
-
 class Request(object):
-    def __init__(self, idx, exec_time, start_time, flow_id, expected_length):
-        self.idx = idx
-        self.network_time = 0
-        self.exec_time = exec_time
-        self.start_time = start_time
-        self.flow_id = flow_id
-        self.expected_length = exec_time
+    __slots__ = ('idx', 'network_time', 'exec_time', 'start_time', 'flow_id',
+                 'expected_length')
 
     def __init__(self, idx, exec_time, network_time, start_time, flow_id,
                  expected_length=0):
@@ -16,4 +9,5 @@ class Request(object):
         self.exec_time = exec_time
         self.start_time = start_time
         self.flow_id = flow_id
+        # Queues account for the actual execution time of the request
         self.expected_length = exec_time
@@ -12,6 +12,9 @@ gen_dict = {
     "exponential": "ExponentialGenerator",
 }
 
+# Number of values drawn at once by the request generators
+BLOCK_SIZE = 65536
+
 
 class FixedGenerator(object):
     def __init__(self, opts, is_network):
@@ -26,6 +29,9 @@ class FixedGenerator(object):
     def sample(self):
         return self.runtime
 
+    def sample_block(self, n):
+        return np.full(n, self.runtime)
+
 
 class LognormalGenerator(object):
     def __init__(self, opts, is_network):
@@ -48,6 +54,9 @@ class LognormalGenerator(object):
     def sample(self):
         return np.random.lognormal(self.log_mean, self.var)
 
+    def sample_block(self, n):
+        return np.random.lognormal(self.log_mean, self.var, n)
+
 
 class ExponentialGenerator(object):
     def __init__(self, mean):
@@ -59,13 +68,18 @@ class ExponentialGenerator(object):
     def sample(self):
         return np.random.exponential(self.mean)
 
+    def sample_block(self, n):
+        return np.random.exponential(self.mean, n)
+
 
 class RequestGenerator(object):
-    def __init__(self, env, host, num_cores, opts):
+    def __init__(self, env, host, num_cores, opts, block_size=BLOCK_SIZE):
         self.env = env
         self.host = host
         self.load = opts["load"]
         self.num_cores = num_cores
+        self.block_size = block_size
+        self.arrival_time = 0.0
 
         network_gen = getattr(sys.modules[__name__],
                               gen_dict[opts["network_gen"]])
@@ -85,24 +99,79 @@ class RequestGenerator(object):
         self.host = host
 
     def begin_generation(self):
-        self.action = self.env.process(self.run())
+        if hasattr(self.env, 'call_soon'):
+            # The heap engine runs the arrivals as plain callbacks, the
+            # requests and draws are the same as the process ones
+            self.env.call_soon(self.start_arrivals)
+        else:
+            self.action = self.env.process(self.run())
 
     def set_flow_id(self, flow_id):
         self.flow_id = flow_id
 
+    def sample_blocks(self):
+        # Blocks of requests (arrival, application and network times) drawn
+        # like the process draws them, for the vector engine to take one at
+        # a time
+        last_arrival = 0.0
+        while True:
+            inter_times = self.inter_gen.sample_block(self.block_size)
+            network_times = self.network_gen.sample_block(self.block_size)
+            app_times = self.app_gen.sample_block(self.block_size)
+            # The arrivals add up the inter-arrival times one at a time like
+            # the successive timeouts
+            arrivals = np.cumsum(np.concatenate(([last_arrival],
+                                                 inter_times)))[1:]
+            last_arrival = arrivals[-1]
+            yield arrivals, app_times, network_times
+
+    def draw_block(self):
+        self.inter_times = self.inter_gen.sample_block(
+            self.block_size).tolist()
+        self.network_times = self.network_gen.sample_block(
+            self.block_size).tolist()
+        self.app_times = self.app_gen.sample_block(self.block_size).tolist()
+        self.block_index = 0
+
+    def start_arrivals(self, event):
+        self.idx = 0
+        self.draw_block()
+        self.wait_arrival()
+
+    def wait_arrival(self):
+        inter_time = self.inter_times[self.block_index]
+        self.arrival_time = self.env.now + inter_time
+        self.env.call_later(inter_time, self.arrive)
+
+    def arrive(self, event):
+        i = self.block_index
+        self.host.receive_request(Request(self.idx, self.app_times[i],
+                                          self.network_times[i],
+                                          self.env.now, self.flow_id))
+        self.idx += 1
+        self.block_index += 1
+        if self.block_index == self.block_size:
+            self.draw_block()
+        self.wait_arrival()
+
     def run(self):
         idx = 0
         while True:
-            # Generate inter-arrival time
-            s = self.inter_gen.sample()
-            yield self.env.timeout(s)
+            # Draw the next block of requests at once
+            inter_times = self.inter_gen.sample_block(self.block_size).tolist()
+            network_times = self.network_gen.sample_block(
+                self.block_size).tolist()
+            app_times = self.app_gen.sample_block(self.block_size).tolist()
 
-            network_time = self.network_gen.sample()
-            app_time = self.app_gen.sample()
+            for i in range(self.block_size):
+                # Wait for the inter-arrival time
+                self.arrival_time = self.env.now + inter_times[i]
+                yield self.env.timeout(inter_times[i])
 
-            self.host.receive_request(Request(idx, app_time, network_time,
-                                              self.env.now, self.flow_id))
-            idx += 1
+                self.host.receive_request(Request(idx, app_times[i],
+                                                  network_times[i],
+                                                  self.env.now, self.flow_id))
+                idx += 1
 
 
 class MultipleRequestGenerator(object):
@@ -112,6 +181,8 @@ class MultipleRequestGenerator(object):
         self.generators = []
         self.cur_flow_id = 0
         self.idx = 0
+        # Trace the requests are recorded to, if any
+        self.trace = None
 
     def add_generator(self, gen):
         gen.set_flow_id(self.cur_flow_id)
@@ -119,12 +190,19 @@ class MultipleRequestGenerator(object):
         self.generators.append(gen)
 
     def begin_generation(self):
+        self.host.set_request_generator(self)
         for i in self.generators:
             i.set_host(self)
             i.begin_generation()
 
+    def next_arrival(self):
+        # Time at which the next request of any flow reaches the host
+        return min(gen.arrival_time for gen in self.generators)
+
     def receive_request(self, request):
         request.idx = self.idx
+        if self.trace is not None:
+            self.trace.record(request)
         self.host.receive_request(request)
         self.idx += 1
 
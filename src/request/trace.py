@@ -0,0 +1,130 @@
+import logging
+import numpy as np
+
+from request import Request
+
+# Header of a trace, with the time up to which it holds every request and
+# its number of flows
+HEADER = np.dtype([('magic', 'S8'), ('horizon', '<f8'), ('num_flows', '<i4')])
+MAGIC = 'simtrace'
+
+# One fixed width record per generated request
+RECORD = np.dtype([('arrival', '<f8'), ('flow', '<i4'), ('exec_time', '<f8'),
+                   ('network_time', '<f8')])
+
+# Requests kept before they are written and replayed at once
+CHUNK_SIZE = 65536
+
+
+class TraceWriter(object):
+    """Appends the requests reaching the host to a binary trace, so that
+    other hosts can be fed the exact same requests. The horizon of the
+    header is only known once the trace is closed."""
+
+    def __init__(self, path, num_flows):
+        self.f = open(path, 'wb')
+        self.num_flows = num_flows
+        self.write_header(float('nan'))
+        self.requests = []
+
+    def write_header(self, horizon):
+        header = np.array([(MAGIC, horizon, self.num_flows)], dtype=HEADER)
+        header.tofile(self.f)
+
+    def record(self, request):
+        self.requests.append((request.start_time, request.flow_id,
+                              request.exec_time, request.network_time))
+        if len(self.requests) >= CHUNK_SIZE:
+            self.flush()
+
+    def write(self, arrivals, flow, exec_times, network_times):
+        # Bulk version of record for the requests of one flow
+        self.flush()
+        records = np.empty(len(arrivals), dtype=RECORD)
+        records['arrival'] = arrivals
+        records['flow'] = flow
+        records['exec_time'] = exec_times
+        records['network_time'] = network_times
+        records.tofile(self.f)
+
+    def flush(self):
+        if self.requests:
+            np.array(self.requests, dtype=RECORD).tofile(self.f)
+            self.requests = []
+
+    def close(self, horizon):
+        self.flush()
+        self.f.seek(0)
+        self.write_header(horizon)
+        self.f.close()
+
+
+def read_header(path):
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC:
+        raise ValueError('Not a request trace: ' + path)
+    return float(header['horizon'][0]), int(header['num_flows'][0])
+
+
+def read_trace(path):
+    read_header(path)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.itemsize)
+
+
+def check_trace(path, sim_time, num_flows):
+    # A trace only replays the flows it was recorded with, and has no
+    # requests past the end of the recording run
+    horizon, trace_flows = read_header(path)
+    if trace_flows != num_flows:
+        raise ValueError('Trace {} has {} flows, the configuration {}'
+                         .format(path, trace_flows, num_flows))
+    if not horizon >= float(sim_time):
+        logging.warning('Trace {} only has requests until {}, no request'
+                        ' arrives after that'.format(path, horizon))
+
+
+class TraceRequestGenerator(object):
+    """Replays the requests of one flow of a trace instead of drawing them,
+    it can take the place of a RequestGenerator with any engine."""
+
+    def __init__(self, env, host, trace):
+        self.env = env
+        self.host = host
+        self.trace = trace
+        self.arrival_time = float('inf')
+
+    def set_host(self, host):
+        self.host = host
+
+    def set_flow_id(self, flow_id):
+        self.flow_id = flow_id
+
+    def begin_generation(self):
+        self.action = self.env.process(self.run())
+
+    def flow_records(self):
+        # The records of a flow are in arrival order
+        return self.trace[self.trace['flow'] == self.flow_id]
+
+    def sample_blocks(self):
+        # The whole flow makes a single block
+        records = self.flow_records()
+        yield (np.array(records['arrival']), np.array(records['exec_time']),
+               np.array(records['network_time']))
+
+    def run(self):
+        records = self.flow_records()
+        idx = 0
+        for begin in range(0, len(records), CHUNK_SIZE):
+            chunk = records[begin:begin + CHUNK_SIZE]
+            for arrival, exec_time, network_time in zip(
+                    chunk['arrival'].tolist(), chunk['exec_time'].tolist(),
+                    chunk['network_time'].tolist()):
+                self.arrival_time = arrival
+                yield self.env.timeout(arrival - self.env.now)
+
+                self.host.receive_request(Request(idx, exec_time,
+                                                  network_time, self.env.now,
+                                                  self.flow_id))
+                idx += 1
+        self.arrival_time = float('inf')
@@ -1,4 +1,5 @@
 import logging
+from queue.request_queue import FIFORequestQueue
 
 
 class ShinjukuScheduler(object):
@@ -67,7 +68,7 @@ class ShinjukuScheduler(object):
                           .format(done_request.idx, self.env.now))
             flow_id = done_request.flow_id
             latency = self.env.now - done_request.start_time
-            self.histograms.record_value(flow_id, latency)
+            self.histograms.record_value(flow_id, latency, done_request)
 
         if not self.active:
             self.env.process(self.become_active())
@@ -111,6 +112,8 @@ class CoreScheduler(object):
         self.core_id = core_id
         self.flow_config = flow_config
         self.active = False
+        # The debug messages of the hot path are only formatted when logged
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
     def set_queue(self, queue):
         self.queue = queue
@@ -121,37 +124,157 @@ class CoreScheduler(object):
     def active(self):
         return self.active
 
-    def process_request(self, request):
-        logging.debug('Scheduler: Assigning request {} to core {} at {}'
-                      .format(request.idx, self.core_id, self.env.now))
+    def drop_late_request(self, request):
+        # Drop the request if it is already bound to violate its SLO. The
+        # queue may have been emptied while the core waited for its lock.
+        if (request is None or
+                not self.flow_config[request.flow_id].get('drop')):
+            return False
+        total_time = self.env.now - request.start_time + request.exec_time
+        target_slo = self.flow_config[request.flow_id].get('slo',
+                                                           float('inf'))
+        if total_time > target_slo:
+            self.histograms.drop_request(request.flow_id)
+            return True
+        return False
+
+    def may_coalesce_slices(self, request):
+        # Consecutive slices can only be merged when the core dequeues the
+        # request again by itself at each preemption
+        return (self.queue.dequeue_time == 0.0 and self.queue.empty() and
+                not self.flow_config[request.flow_id].get('drop'))
+
+    def coalescing_horizon(self):
+        # With free dequeues the other cores put their preempted requests
+        # back and take them again at once, so only new arrivals can leave
+        # requests waiting in a FIFO queue. Dequeue policies of per flow
+        # queues keep state, so there any event may change the schedule.
+        if isinstance(self.queue, FIFORequestQueue):
+            return self.host.next_arrival()
+        return self.env.peek()
+
+    def start_request(self, request):
+        # Start running the request, returns how long it runs for and the
+        # method to call with it after that
+        if self.debug:
+            logging.debug('Scheduler: Assigning request {} to core {} at {}'
+                          .format(request.idx, self.core_id, self.env.now))
 
         time_slice = self.flow_config[request.flow_id].get('time_slice')
         if (time_slice == 0 or time_slice >= request.exec_time):
-            yield self.env.timeout(request.exec_time + request.network_time)
-            latency = self.env.now - request.start_time
+            return (request.exec_time + request.network_time,
+                    self.complete_request)
+
+        step = time_slice + float(self.flow_config[request.flow_id].
+                                  get('preemption'))
+        start = self.env.now
+        end = start + step
+        slices = 0
+        if self.may_coalesce_slices(request):
+            # Nothing else can be waiting for the core before the
+            # horizon, so the request gets the core back at every slice
+            # boundary before it. Wait for all those slices at once.
+            horizon = self.coalescing_horizon()
+            remaining = request.exec_time - time_slice
+            while end < horizon and time_slice < remaining:
+                slices += 1
+                end += step
+                remaining -= time_slice
+
+            # Only coalesce if the single timeout lands exactly where
+            # the successive ones would have
+            if start + (end - start) != end:
+                slices = 0
+                end = start + step
+
+        # Replay the skipped preemptions, the request is the only one
+        # in the queue so it is dequeued right after being put back
+        for i in range(slices):
+            request.exec_time -= time_slice
+            request.expected_length -= time_slice
+            self.queue.renqueue(request)
+            self.queue.dequeue()
+
+        return end - start, self.preempt_request
+
+    def complete_request(self, request):
+        latency = self.env.now - request.start_time
+        if self.debug:
             logging.debug('Scheduler: Request {} Latency {}'.format
                           (request.idx, latency))
-            flow_id = request.flow_id
-            self.histograms.record_value(flow_id, latency)
+        flow_id = request.flow_id
+        self.histograms.record_value(flow_id, latency, request)
+        if self.debug:
             logging.debug('Scheduler: Request {} finished execution at core {}'
                           ' at {}'.format(request.idx, self.core_id,
                                           self.env.now))
-        else:
-            yield self.env.timeout(time_slice + float(
-                                   self.flow_config[request.flow_id].
-                                   get('preemption')))
-            request.exec_time -= time_slice
-            request.expected_length -= time_slice
+
+    def preempt_request(self, request):
+        time_slice = self.flow_config[request.flow_id].get('time_slice')
+        request.exec_time -= time_slice
+        request.expected_length -= time_slice
+        if self.debug:
             logging.debug('Scheduler: Request {} preempted at core {} at {}'
                           .format(request.idx, self.core_id, self.env.now))
 
-            # FIXME Add enqueue cost/lock
-            # Add the unfinished request to the queue
-            # print request
-            # print request.idx
-            # print self.queue.q
-            self.queue.renqueue(request)
-            # print self.queue.q
+        # FIXME Add enqueue cost/lock
+        # Add the unfinished request to the queue
+        self.queue.renqueue(request)
+
+    def process_request(self, request):
+        delay, finish = self.start_request(request)
+        yield self.env.timeout(delay)
+        finish(request)
+
+    def input_queue(self):
+        return self.queue
+
+    def report_idle(self, request):
+        if self.host:
+            self.host.core_become_idle(self, request)
+
+    def activate(self):
+        # With free dequeues on the heap engine the loop of the core runs as
+        # plain callbacks, starting where its process would. Dequeuing costs
+        # need the queue lock, so they keep the become_active process.
+        if (self.input_queue().dequeue_time == 0.0 and
+                hasattr(self.env, 'call_soon')):
+            self.env.call_soon(self.start_loop)
+        else:
+            self.env.process(self.become_active())
+
+    def start_loop(self, event):
+        if self.active:
+            return
+        self.active = True
+        self.last_request = None
+        if self.debug:
+            logging.debug("CoreScheduler: Core {} becomes active at {}"
+                          .format(self.core_id, self.env.now))
+        self.next_request()
+
+    def next_request(self):
+        # Same steps as the inline path of become_active, the completion of
+        # the running request calls it again
+        queue = self.input_queue()
+        while not queue.empty():
+            request = queue.dequeue()
+            self.last_request = request
+            if not self.drop_late_request(request):
+                delay, self.finish = self.start_request(request)
+                self.running = request
+                self.env.call_later(delay, self.request_done)
+                return
+
+        if self.debug:
+            logging.debug("CoreScheduler: Core {} becomes idle at {}"
+                          .format(self.core_id, self.env.now))
+        self.active = False
+        self.report_idle(self.last_request)
+
+    def request_done(self, event):
+        self.finish(self.running)
+        self.next_request()
 
     # Start up if not already looping
     def become_active(self):
@@ -164,6 +287,15 @@ class CoreScheduler(object):
         logging.debug("CoreScheduler: Core {} becomes active at {}"
                       .format(self.core_id, self.env.now))
         while not self.queue.empty():
+            if self.queue.dequeue_time == 0.0:
+                # Dequeuing is free, so there is no need for the queue lock
+                # or a separate process: run the request inline
+                request = self.queue.dequeue()
+                if not self.drop_late_request(request):
+                    for event in self.process_request(request):
+                        yield event
+                continue
+
             # Keep waiting for request
             req = self.queue.resource.request()
 
@@ -176,12 +308,7 @@ class CoreScheduler(object):
 
             request = self.queue.dequeue()
 
-            total_time = self.env.now - request.start_time + request.exec_time
-            target_slo = self.flow_config[request.flow_id].get('slo',
-                                                               float('inf'))
-            if ((total_time > target_slo and
-                 self.flow_config[request.flow_id].get('drop'))):
-                self.histograms.drop_request(request.flow_id)
+            if self.drop_late_request(request):
                 self.env.timeout(0.0)
                 self.queue.resource.release(req)
             else:
@@ -205,71 +332,75 @@ class CoreScheduler(object):
 
 
 class MixedCoreScheduler(CoreScheduler):
-    def process_request(self, request):
-        logging.debug('Scheduler: Assigning request {} to core {} at {}'
-                      .format(request.idx, self.core_id, self.env.now))
+    def start_request(self, request):
+        if self.debug:
+            logging.debug('Scheduler: Assigning request {} to core {} at {}'
+                          .format(request.idx, self.core_id, self.env.now))
 
         time_slice = self.flow_config[request.flow_id].get('time_slice')
         if request.network_time != 0:
             if time_slice == 0 or time_slice >= request.network_time:
-                yield self.env.timeout(request.network_time)
-                request.network_time = 0
-                self.queue.renqueue(request)
-                logging.debug('Scheduler: Request {} finished net at core {}'
-                              ' at {}'.format(request.idx, self.core_id,
-                                              self.env.now))
-            else:
-                yield self.env.timeout(time_slice)
-                request.network_time -= time_slice
-                self.queue.renqueue(request)
-                logging.debug('Scheduler: Request {} preempted net at core {}'
-                              ' at {}'.format(request.idx, self.core_id,
-                                              self.env.now))
-        else:
-            if (time_slice == 0 or time_slice >= request.exec_time):
-                yield self.env.timeout(request.exec_time)
-                latency = self.env.now - request.start_time
-                logging.debug('Scheduler: Request {} Latency {}'.format
-                              (request.idx, latency))
-                flow_id = request.flow_id
-                self.histograms.record_value(flow_id, latency)
-                logging.debug('Scheduler: Request {} finished execution at'
-                              ' core {} at {}'.format(request.idx,
-                                                      self.core_id,
-                                                      self.env.now))
-            else:
-                yield self.env.timeout(time_slice + float(
-                                       self.flow_config[request.flow_id].
-                                       get('preemption')))
-                request.exec_time -= time_slice
-                request.expected_length -= time_slice
-                logging.debug('Scheduler: Request {} preempted at core {}'
-                              ' at {}'.format(request.idx, self.core_id,
-                                              self.env.now))
-                self.queue.renqueue(request)
+                return request.network_time, self.complete_network
+            return time_slice, self.preempt_network
+        if (time_slice == 0 or time_slice >= request.exec_time):
+            return request.exec_time, self.complete_request
+        return (time_slice + float(self.flow_config[request.flow_id].
+                                   get('preemption')), self.preempt_request)
+
+    def complete_network(self, request):
+        request.network_time = 0
+        self.queue.renqueue(request)
+        if self.debug:
+            logging.debug('Scheduler: Request {} finished net at core {}'
+                          ' at {}'.format(request.idx, self.core_id,
+                                          self.env.now))
+
+    def preempt_network(self, request):
+        time_slice = self.flow_config[request.flow_id].get('time_slice')
+        request.network_time -= time_slice
+        self.queue.renqueue(request)
+        if self.debug:
+            logging.debug('Scheduler: Request {} preempted net at core {}'
+                          ' at {}'.format(request.idx, self.core_id,
+                                          self.env.now))
 
 
 class NetworkCoreScheduler(CoreScheduler):
-    def process_request(self, request):
-        logging.debug('NetScheduler: Assigning request {} to core {} at {}'
-                      .format(request.idx, self.core_id, self.env.now))
+    def start_request(self, request):
+        if self.debug:
+            logging.debug('NetScheduler: Assigning request {} to core {} at'
+                          ' {}'.format(request.idx, self.core_id,
+                                       self.env.now))
 
         time_slice = self.flow_config[request.flow_id].get('time_slice')
         if time_slice == 0 or time_slice >= request.network_time:
-            yield self.env.timeout(request.network_time)
-            request.network_time = 0
-            self.host.receive_request(request)
+            return request.network_time, self.complete_request
+        return time_slice, self.preempt_request
+
+    def complete_request(self, request):
+        request.network_time = 0
+        self.host.receive_request(request)
+        if self.debug:
             logging.debug('NetScheduler: Request {} finished net at core {}'
-                            ' at {}'.format(request.idx, self.core_id,
-                                            self.env.now))
-        else:
-            yield self.env.timeout(time_slice)
-            request.network_time -= time_slice
-            self.queue[0].renqueue(request)
+                          ' at {}'.format(request.idx, self.core_id,
+                                          self.env.now))
+
+    def preempt_request(self, request):
+        time_slice = self.flow_config[request.flow_id].get('time_slice')
+        request.network_time -= time_slice
+        self.queue[0].renqueue(request)
+        if self.debug:
             logging.debug('NetScheduler: Request {} preempted net at core {}'
                           ' at {}'.format(request.idx, self.core_id,
                                           self.env.now))
 
+    def input_queue(self):
+        return self.queue[0]
+
+    def report_idle(self, request):
+        if self.host:
+            self.host.core_become_idle(self, request, True)
+
     def become_active(self):
         if (self.active):
             return
@@ -280,6 +411,15 @@ class NetworkCoreScheduler(CoreScheduler):
         logging.debug("NetworkScheduler: Core {} becomes active at {}"
                       .format(self.core_id, self.env.now))
         while not self.queue[0].empty():
+            if self.queue[0].dequeue_time == 0.0:
+                # Dequeuing is free, so there is no need for the queue lock
+                # or a separate process: run the request inline
+                request = self.queue[0].dequeue()
+                if not self.drop_late_request(request):
+                    for event in self.process_request(request):
+                        yield event
+                continue
+
             # Keep waiting for request
             req = self.queue[0].resource.request()
 
@@ -292,12 +432,7 @@ class NetworkCoreScheduler(CoreScheduler):
 
             request = self.queue[0].dequeue()
 
-            total_time = self.env.now - request.start_time + request.exec_time
-            target_slo = self.flow_config[request.flow_id].get('slo',
-                                                               float('inf'))
-            if ((total_time > target_slo and
-                 self.flow_config[request.flow_id].get('drop'))):
-                self.histograms.drop_request(request.flow_id)
+            if self.drop_late_request(request):
                 self.env.timeout(0.0)
                 self.queue[0].resource.release(req)
             else:
@@ -321,30 +456,43 @@ class NetworkCoreScheduler(CoreScheduler):
 
 
 class AppCoreScheduler(CoreScheduler):
-    def process_request(self, request):
-        logging.debug('AppScheduler: Assigning request {} to core {} at {}'
-                      .format(request.idx, self.core_id, self.env.now))
+    def start_request(self, request):
+        if self.debug:
+            logging.debug('AppScheduler: Assigning request {} to core {} at'
+                          ' {}'.format(request.idx, self.core_id,
+                                       self.env.now))
 
         time_slice = self.flow_config[request.flow_id].get('time_slice')
         if time_slice == 0 or time_slice >= request.exec_time:
-            yield self.env.timeout(request.exec_time)
-            request.exec_time = 0
-            latency = self.env.now - request.start_time
+            return request.exec_time, self.complete_request
+        return time_slice, self.preempt_request
+
+    def complete_request(self, request):
+        request.exec_time = 0
+        latency = self.env.now - request.start_time
+        if self.debug:
             logging.debug('AppScheduler: Request {} Latency {}'.format
                           (request.idx, latency))
-            flow_id = request.flow_id
-            self.histograms.record_value(flow_id, latency)
+        flow_id = request.flow_id
+        self.histograms.record_value(flow_id, latency, request)
+        if self.debug:
             logging.debug('AppScheduler: Request {} finished execution at'
                           ' core {} at {}'.format(request.idx, self.core_id,
                                                   self.env.now))
-        else:
-            yield self.env.timeout(time_slice)
-            request.app_time -= time_slice
-            self.queue.renqueue(request)
+
+    def preempt_request(self, request):
+        time_slice = self.flow_config[request.flow_id].get('time_slice')
+        request.app_time -= time_slice
+        self.queue.renqueue(request)
+        if self.debug:
             logging.debug('AppScheduler: Request {} preempted app at core {}'
                           ' at {}'.format(request.idx, self.core_id,
                                           self.env.now))
 
+    def report_idle(self, request):
+        if self.host:
+            self.host.core_become_idle(self, request, False)
+
     def become_active(self):
         if (self.active):
             return
@@ -355,6 +503,15 @@ class AppCoreScheduler(CoreScheduler):
         logging.debug("AppScheduler: Core {} becomes active at {}"
                       .format(self.core_id, self.env.now))
         while not self.queue.empty():
+            if self.queue.dequeue_time == 0.0:
+                # Dequeuing is free, so there is no need for the queue lock
+                # or a separate process: run the request inline
+                request = self.queue.dequeue()
+                if not self.drop_late_request(request):
+                    for event in self.process_request(request):
+                        yield event
+                continue
+
             # Keep waiting for request
             req = self.queue.resource.request()
 
@@ -367,12 +524,7 @@ class AppCoreScheduler(CoreScheduler):
 
             request = self.queue.dequeue()
 
-            total_time = self.env.now - request.start_time + request.exec_time
-            target_slo = self.flow_config[request.flow_id].get('slo',
-                                                               float('inf'))
-            if ((total_time > target_slo and
-                 self.flow_config[request.flow_id].get('drop'))):
-                self.histograms.drop_request(request.flow_id)
+            if self.drop_late_request(request):
                 self.env.timeout(0.0)
                 self.queue.resource.release(req)
             else:
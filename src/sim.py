@@ -1,19 +1,30 @@
 #!/usr/bin/env python
 
 import numpy as np
+import os
 import sys
+import copy
 import json
 import simpy
+import socket
 import logging
 import argparse
+import multiprocessing
 
 
 # import matplotlib.pyplot as plt
-from util.histogram import Histogram
+from util.histogram import (Histogram, merge_states, add_warmup,
+                            PERCENTILES, WINDOW_FIELDS)
+from util.result_cache import open_cache, opts_key
+from util.result import Result
+from engine.event_heap import Environment as HeapEnvironment
+from engine.vector import VectorFCFSEngine, vector_eligible
 
 from host.host import *
 from request.request_generator import *
 from request.interarrival_generator import *
+from request.trace import (TraceWriter, TraceRequestGenerator, read_trace,
+                           check_trace)
 
 
 gen_dict = {
@@ -34,11 +45,17 @@ gen_dict = {
     'local': 'MultiQueueHost',
     'shinjuku':  'ShinjukuHost',
     'perflow': 'PerFlowQueueHost',
-    'staticcore': 'StaticCoreAllocationHost'
+    'staticcore': 'StaticCoreAllocationHost',
+    'ps': 'ProcessorSharingHost'
 }
 
+engine_dict = {
+    'simpy': simpy.Environment,
+    'heap': HeapEnvironment
+}
 
-def main():
+
+def parse_options(args=None):
     # parser = optparse.OptionParser()
     parser = argparse.ArgumentParser(description='')
 
@@ -55,17 +72,30 @@ def main():
                         ' cores of the system', default=0)
     parser.add_argument('-s', '--seed', dest='seed', action='store',
                       help='Set the seed for request generator')
+    parser.add_argument('--seeds', dest='seeds', action='store', type=int,
+                        nargs='+', help='Run one replication per seed and'
+                        ' print the per seed and merged results', default=None)
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                        help='Number of processes running the replications'
+                        ' given with --seeds', default=1)
     parser.add_argument('-t', '--sim_time', dest='sim_time', action='store',
                       help='Set the simulation time', default=500000)
     parser.add_argument('--workload-conf', dest='work_conf', action='store',
                       help='Configuration file for the load generation'
                       ' functions', default="../config/work.json")
+    parser.add_argument('--engine', dest='engine', action='store',
+                        choices=sorted(engine_dict.keys()) + ['vector'],
+                        help='Set the simulation engine (simpy, the native'
+                        ' event heap or the vectorized FCFS engine, which'
+                        ' falls back to the event heap when the host is'
+                        ' not a plain FCFS global queue)', default='simpy')
 
     group = parser.add_argument_group('Host Options')
     group.add_argument('--host-type', dest='host_type', action='store',
                      help=('Set the host configuration (global queue,'
                            ' local queue, shinjuku, per flow queues,'
-                           ' static core allocation)'), default='global')
+                           ' static core allocation, processor sharing)'),
+                     default='global')
     group.add_argument('--deq-cost', dest='deq_cost', action='store',
                      help='Set the dequeuing cost', default=0.0)
     group.add_argument('--queue-policy', dest='queue_policy', action='store',
@@ -74,19 +104,115 @@ def main():
                            ' configuration'), default='FlowQueues')
     parser.add_argument_group(group)
 
+    group = parser.add_argument_group('Window Options')
+    group.add_argument('--window', dest='window', action='store', type=float,
+                       help='Also summarize the latencies, throughput,'
+                       ' goodput and drops of each flow over consecutive'
+                       ' intervals of this length', default=None)
+    group.add_argument('--window-file', dest='window_file', action='store',
+                       help='Save the per interval series as an array of'
+                       ' (flow, interval, field) in this .npz file instead'
+                       ' of adding them to the results', default=None)
+    parser.add_argument_group(group)
+
+    group = parser.add_argument_group('Stopping Options')
+    group.add_argument('--target-ci', dest='target_ci', action='store',
+                       type=float, help='Stop once the 95%% confidence'
+                       ' interval of the target percentile of every flow'
+                       ' is within this fraction of its estimate, the'
+                       ' simulation time becomes an upper bound',
+                       default=None)
+    group.add_argument('--target-percentile', dest='target_percentile',
+                       action='store', type=float, help='Latency percentile'
+                       ' whose confidence interval is checked', default=99.0)
+    group.add_argument('--batch-time', dest='batch_time', action='store',
+                       type=float, help='Length of the batches giving one'
+                       ' sample of the percentile each, the interval is'
+                       ' checked at the end of every batch (a hundredth of'
+                       ' the simulation time by default)', default=None)
+    group.add_argument('--warmup', dest='warmup', action='store',
+                       help='Leave out the requests completing before this'
+                       ' time, or before the end of the warmup found by'
+                       ' MSER-5 on the per interval mean latencies with'
+                       ' "mser"', default=None)
+    group.add_argument('--min-batches', dest='min_batches', action='store',
+                       type=int, help='Batches needed before the simulation'
+                       ' can stop', default=10)
+    parser.add_argument_group(group)
+
+    group = parser.add_argument_group('Trace Options')
+    group.add_argument('--record-trace', dest='record_trace', action='store',
+                       help='Write the requests reaching the host (arrival'
+                       ' time, flow, execution and network times) to this'
+                       ' binary trace', default=None)
+    group.add_argument('--replay-trace', dest='replay_trace', action='store',
+                       help='Feed the requests of this trace to the host'
+                       ' instead of drawing them, to compare hosts on the'
+                       ' same requests', default=None)
+    parser.add_argument_group(group)
+
+    group = parser.add_argument_group('Worker Options')
+    group.add_argument('--serve', dest='serve', action='store_true',
+                       help='Keep running and simulate the jobs read as JSON'
+                       ' lines ({"id", "args", "flow_config"}) from stdin,'
+                       ' writing one JSON line with the result of each',
+                       default=False)
+    group.add_argument('--socket', dest='socket', action='store',
+                       help='Read the jobs from the connections to this Unix'
+                       ' socket instead of stdin', default=None)
+    parser.add_argument_group(group)
+
+    group = parser.add_argument_group('Cache Options')
+    group.add_argument('--cache-dir', dest='cache_dir', action='store',
+                       help='Reuse the results of previous runs with the same'
+                       ' configuration and seed stored in this directory',
+                       default=None)
+    group.add_argument('--cache-size', dest='cache_size', action='store',
+                       type=float, help='Size of the cache directory in MB'
+                       ' after which the least recently used results are'
+                       ' removed', default=1024)
+    parser.add_argument_group(group)
+
     group = parser.add_argument_group('Print Options')
     group.add_argument('--print-values', dest='print_values',
                      action='store_true', help='Print all the latencies for'
                      ' each flow', default=False)
     group.add_argument('--output-file', dest='output_file', action='store',
                      help='File to print all latencies', default=None)
+    group.add_argument('--log-format', dest='log_format', action='store',
+                       choices=['text', 'binary'], help='Print the latencies'
+                       ' as one text file per flow or as a single binary'
+                       ' log of (request id, flow, start, completion)'
+                       ' records in <output-file>.lat', default='text')
+    group.add_argument('--percentiles', dest='percentiles', action='store',
+                       type=float, nargs='+', help='Latency percentiles to'
+                       ' report for each flow, along with the count, mean,'
+                       ' max and standard deviation', default=PERCENTILES)
+    group.add_argument('--histograms', dest='histograms',
+                       action='store_true', help='Add the compressed'
+                       ' histogram encoding of each flow to the results',
+                       default=False)
+    group.add_argument('--histogram-backend', dest='histogram_backend',
+                       action='store', choices=['hdr', 'log', 'kll'],
+                       help='HdrHistogram, which keeps integer latencies'
+                       ' between 1 and 1e6, a log bucketed NumPy histogram'
+                       ' that grows to cover any latency, or a constant'
+                       ' memory KLL quantile sketch', default='hdr')
+    group.add_argument('--precision', dest='precision', action='store',
+                       type=int, help='Significant digits kept by the'
+                       ' latency histograms', default=2)
+    group.add_argument('--sketch-size', dest='sketch_size', action='store',
+                       type=int, help='Items per level of the KLL sketches,'
+                       ' the rank error is about 1.7 / size', default=200)
 
-    opts = parser.parse_args()
+    opts = parser.parse_args(args)
+    if opts.warmup is not None and opts.warmup != 'mser':
+        opts.warmup = float(opts.warmup)
+    return opts
 
-    # Seeding
-    if opts.seed:
-        random.seed(int(opts.seed))
-        np.random.seed(int(opts.seed))
+
+def main():
+    opts = parse_options()
 
     # Setup logging
     log_level = logging.WARNING
@@ -96,20 +222,245 @@ def main():
         log_level = logging.DEBUG
     logging.basicConfig(level=log_level)
 
-    # Initialize the different components of the system
-    env = simpy.Environment()
+    if opts.serve:
+        serve(opts)
+        return
 
     # Parse the configuration file
     flow_config = json.loads(open(opts.work_conf).read())
 
+    # Print results in json format
+    print json.dumps(run(opts, flow_config))
+
+
+def choose_engine(opts, flow_config):
+    if (opts.engine == 'vector' and
+            not vector_eligible(opts.host_type, float(opts.deq_cost),
+                                flow_config)):
+        logging.warning('The vector engine only supports FCFS global queues'
+                        ' without drops or dequeuing cost, using the heap'
+                        ' engine instead')
+        opts.engine = 'heap'
+    if opts.engine == 'vector' and opts.target_ci:
+        logging.warning('The vector engine can\'t stop before the end of'
+                        ' the simulation, using the heap engine instead')
+        opts.engine = 'heap'
+
+
+def run(opts, flow_config):
+    # Results of one simulation, or of every seed and merged with --seeds
+    choose_engine(opts, flow_config)
+    if opts.seeds:
+        replications = [(opts, flow_config, seed) for seed in opts.seeds]
+        if opts.jobs > 1:
+            pool = multiprocessing.Pool(opts.jobs)
+            results = pool.map(run_replication, replications)
+            pool.close()
+            pool.join()
+        else:
+            results = [run_replication(r) for r in replications]
+
+        if opts.histograms:
+            for info, state in results:
+                add_histograms(info, state)
+
+        return {
+            'seeds': opts.seeds,
+            'runs': [info for info, state in results],
+            'merged': merge_states([state for info, state in results],
+                                   float(opts.cores), opts.histograms,
+                                   opts.percentiles)
+        }
+
+    info, state = run_cached(opts, flow_config)
+    if opts.histograms:
+        add_histograms(info, state)
+    return info
+
+
+def serve(opts):
+    # Worker that saves the startup of a new sim.py for every run
+    if opts.socket is None:
+        serve_stream(sys.stdin, sys.stdout)
+        return
+
+    if os.path.exists(opts.socket):
+        os.remove(opts.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(opts.socket)
+    server.listen(1)
+    try:
+        while True:
+            connection, _ = server.accept()
+            stream = connection.makefile('rw')
+            try:
+                serve_stream(stream, stream)
+            finally:
+                stream.close()
+                connection.close()
+    finally:
+        server.close()
+        os.remove(opts.socket)
+
+
+def serve_stream(jobs, results):
+    # One JSON line with the id and the result or error of every job line
+    for line in iter(jobs.readline, ''):
+        if not line.strip():
+            continue
+        results.write(json.dumps(run_job(line)) + '\n')
+        results.flush()
+
+
+def run_job(line):
+    # The job gives the command line arguments of sim.py and the flow
+    # configuration itself instead of a file
+    response = {'id': None}
+    # Nothing but the results may go to the output stream
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        job = json.loads(line)
+        response['id'] = job.get('id')
+        opts = parse_options(job.get('args', []))
+        flow_config = job.get('flow_config')
+        if flow_config is None:
+            flow_config = json.loads(open(opts.work_conf).read())
+        response['result'] = run(opts, flow_config)
+    except SystemExit:
+        # argparse already printed the usage
+        response['error'] = 'Invalid arguments'
+    except Exception as e:
+        logging.exception('Job {} failed'.format(response['id']))
+        response['error'] = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        sys.stdout = stdout
+    return response
+
+
+def simulate(flow_config, host_type='global', cores=8, seed=None,
+             **options):
+    """Run a simulation in this process and return its Result. The other
+    options are the ones of the command line, named after their dest (for
+    instance sim_time, engine or percentiles), with the same defaults. When
+    seed is a list every seed is a replication, running in a pool of jobs
+    processes if jobs > 1, and the Result merges them."""
+    opts = parse_options([])
+    for name, value in options.items():
+        if not hasattr(opts, name) or name in ['seeds', 'serve', 'socket']:
+            raise TypeError('Unknown simulation option: ' + name)
+        setattr(opts, name, value)
+    opts.host_type = host_type
+    opts.cores = cores
+    choose_engine(opts, flow_config)
+
+    if not isinstance(seed, (list, tuple)):
+        opts.seed = seed
+        info, state = run_cached(opts, flow_config)
+        return Result(info, state, cores)
+
+    replications = [(opts, flow_config, s) for s in seed]
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs)
+        results = pool.map(run_replication, replications)
+        pool.close()
+        pool.join()
+    else:
+        results = [run_replication(r) for r in replications]
+    return Result.merge([Result(info, state, cores)
+                         for info, state in results], opts.percentiles)
+
+
+def run_replication(replication):
+    # Run one of the seeds given with --seeds, possibly in a worker process
+    opts, flow_config, seed = replication
+    opts = copy.copy(opts)
+    opts.seed = seed
+    if opts.print_values:
+        opts.output_file = opts.output_file + '_seed' + str(seed)
+    if opts.window_file:
+        opts.window_file = opts.window_file + '_seed' + str(seed)
+    if opts.record_trace:
+        opts.record_trace = opts.record_trace + '_seed' + str(seed)
+    if opts.replay_trace:
+        opts.replay_trace = opts.replay_trace + '_seed' + str(seed)
+
+    return run_cached(opts, flow_config)
+
+
+def add_histograms(info, state):
+    for flow_info, encoded in zip(info, state['histograms']):
+        flow_info['histogram'] = encoded
+
+
+def add_windows(info, histograms, opts):
+    windows = histograms.get_windows()
+    if opts.window_file:
+        np.savez(opts.window_file, windows=windows, fields=WINDOW_FIELDS,
+                 window=opts.window)
+        return
+    for flow_info, series in zip(info, windows):
+        flow_info['windows'] = dict((field, series[:, i].tolist())
+                                    for i, field in enumerate(WINDOW_FIELDS))
+
+
+def run_cached(opts, flow_config):
+    # Unseeded runs, runs printing every latency or keeping the per interval
+    # series, runs stopping on their own and traced runs can't be reused
+    cache = None
+    if (opts.cache_dir and opts.seed and not opts.print_values and
+            not opts.window and not opts.target_ci and
+            not opts.record_trace and not opts.replay_trace):
+        cache = open_cache(opts.cache_dir, int(opts.cache_size * 1024 * 1024))
+        key = opts_key(opts, flow_config)
+        result = cache.get(key)
+        if result is not None:
+            # The summary is computed again as the percentiles may differ
+            state = result['state']
+            info = merge_states([state], float(opts.cores),
+                                percentiles=opts.percentiles)
+            add_warmup(info, state)
+            return info, state
+
+    histograms = run_simulation(opts, flow_config)
+    if opts.warmup == 'mser':
+        histograms.detect_warmup()
+    info = histograms.get_info()
+    state = histograms.get_state()
+    add_warmup(info, state)
+    if opts.window:
+        add_windows(info, histograms, opts)
+    if opts.target_ci:
+        for flow_info, convergence in zip(info,
+                                          histograms.get_convergence()):
+            flow_info.update(convergence)
+    if cache is not None:
+        cache.put(key, {'state': state})
+    return info, state
+
+
+def run_simulation(opts, flow_config):
+    # Seeding
+    if opts.seed:
+        random.seed(int(opts.seed))
+        np.random.seed(int(opts.seed))
+
     # Create a histogram per flow and a global histogram
     histograms = Histogram(len(flow_config), float(opts.cores), flow_config,
                            opts)
 
-    # Get the queue configuration
-    host_conf = getattr(sys.modules[__name__], gen_dict[opts.host_type])
-    sim_host = host_conf(env, int(opts.cores), histograms,
-                         float(opts.deq_cost), flow_config, opts)
+    # Initialize the different components of the system
+    if opts.engine == 'vector':
+        env = None
+        sim_host = None
+    else:
+        env = engine_dict[opts.engine]()
+        histograms.env = env
+
+        # Get the queue configuration
+        host_conf = getattr(sys.modules[__name__], gen_dict[opts.host_type])
+        sim_host = host_conf(env, int(opts.cores), histograms,
+                             float(opts.deq_cost), flow_config, opts)
 
     # TODO:Update so that it's parametrizable
     # print "Warning: Need to update sim.py for parameterization and Testing"
@@ -119,7 +470,18 @@ def main():
     #                                     histograms, len(flow_config),
     #                                     [0.4, 0.4])
 
-    multigenerator = MultipleRequestGenerator(env, sim_host)
+    if opts.engine == 'vector':
+        multigenerator = VectorFCFSEngine(int(opts.cores), histograms)
+    else:
+        multigenerator = MultipleRequestGenerator(env, sim_host)
+
+    trace = None
+    if opts.replay_trace:
+        check_trace(opts.replay_trace, opts.sim_time, len(flow_config))
+        trace = read_trace(opts.replay_trace)
+    if opts.record_trace:
+        multigenerator.trace = TraceWriter(opts.record_trace,
+                                           len(flow_config))
 
     # Create one object per flow
     for flow in flow_config:
@@ -132,16 +494,44 @@ def main():
         if (opts.host_type == "shinjuku"):
             opts.cores = int(opts.cores) - 1
 
-        multigenerator.add_generator(RequestGenerator(env, sim_host,
-                                     int(opts.cores), params))
-
-    multigenerator.begin_generation()
+        if trace is not None:
+            multigenerator.add_generator(TraceRequestGenerator(env, sim_host,
+                                                               trace))
+        else:
+            multigenerator.add_generator(RequestGenerator(env, sim_host,
+                                         int(opts.cores), params))
 
     # Run the simulation
-    env.run(until=opts.sim_time)
+    if opts.engine == 'vector':
+        multigenerator.run(opts.sim_time)
+    else:
+        multigenerator.begin_generation()
+        if opts.target_ci:
+            run_until_converged(env, histograms, opts)
+        else:
+            env.run(until=opts.sim_time)
 
-    # Print results in json format
-    histograms.print_info()
+    if multigenerator.trace is not None:
+        multigenerator.trace.close(histograms.stop_time)
+    histograms.close_outputs()
+    return histograms
+
+
+def run_until_converged(env, histograms, opts):
+    # Stop at the end of the first batch after which the percentile of every
+    # flow is precise enough, or at the simulation time
+    sim_time = float(opts.sim_time)
+    batch_time = opts.batch_time or sim_time / 100
+    now = 0.0
+    while now < sim_time:
+        now = min(now + batch_time, sim_time)
+        env.run(until=now)
+        histograms.end_batch()
+        if histograms.converged():
+            break
+    histograms.stop_time = now
+    logging.info('Stopped at {} after {} batches'.format(
+        now, max(len(e) for e in histograms.batches.estimates)))
 
 if __name__ == "__main__":
     main()
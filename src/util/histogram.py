@@ -1,58 +1,606 @@
 #!/usr/bin/env python
 
 import json
+import logging
+import numpy as np
 from hdrh.histogram import HdrHistogram
+from util.latency_log import LatencyLogWriter
+from util.log_histogram import LogHistogram
+from util.log_histogram import ENCODING_PREFIX as LOG_PREFIX
+from util.quantile_sketch import KllSketch
+from util.quantile_sketch import ENCODING_PREFIX as KLL_PREFIX
+from util.statistics import mean_interval, mser
+
+
+# Latencies kept per flow before they are added to the histograms at once
+BUFFER_SIZE = 65536
+
+# Percentiles reported by default along with the 99th percentile latency
+PERCENTILES = [50.0, 90.0, 99.0, 99.9]
+
+# Smallest highest value of the HdrHistograms, the simulations widen it to
+# their simulation time since no latency can be longer
+HDR_HIGHEST = 1000 * 1000
+
+
+def flow_info(histogram, dropped, violations, cores, replications=1,
+              percentiles=PERCENTILES):
+    # Get the total count of received requests
+    total_count = histogram.get_total_count()
+
+    # Get the 99th latency and the distribution summary in one pass
+    recorded = recorded_buckets(histogram)
+    info = percentile_info(histogram, percentiles, recorded)
+
+    # Prepare the json for output
+    info.update({
+        'latency': value_at_percentile(histogram, recorded, 99),
+        'per_core_through': (1.0 * (total_count - dropped) / cores /
+                             replications),
+        'slo_success': 1.0 - (1.0 * violations / total_count),
+        'dropped_requests': dropped
+    })
+    return info
+
+
+class HdrBackend(HdrHistogram):
+    """HdrHistogram with the bulk recording and bucket listing used by
+    Histogram, it only tracks integer values up to its highest trackable
+    value."""
+
+    def record_values(self, values):
+        # HdrHistogram buckets the integer part of the values so one counted
+        # insert per distinct integer gives the same histogram
+        values, counts = np.unique(np.asarray(values).astype(np.int64),
+                                   return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            # HdrHistogram leaves the values out of its range out silently
+            if not self.record_value(value, count):
+                raise ValueError('Latency {} is out of the histogram range'
+                                 ' (highest {})'.format(
+                                     value, self.highest_trackable_value))
+
+    def buckets(self):
+        # Lowest value, highest value, median and count of the non empty
+        # buckets in increasing order
+        counts = np.asarray(self.counts[:self.counts_len], dtype=np.int64)
+        indices = np.flatnonzero(counts)
+        values = [self.get_value_from_index(i) for i in indices.tolist()]
+        lows = np.array([self.get_lowest_equivalent_value(v)
+                         for v in values])
+        highs = np.array([self.get_highest_equivalent_value(v)
+                          for v in values])
+        medians = np.array([self._hdr_median_equiv_value(v) for v in values],
+                           dtype=float)
+        return lows, highs, medians, counts[indices]
+
+
+def new_histogram(backend='hdr', significant_figures=2, sketch_size=200,
+                  highest=HDR_HIGHEST):
+    if backend == 'log':
+        return LogHistogram(significant_figures)
+    if backend == 'kll':
+        return KllSketch(sketch_size)
+    return HdrBackend(1, max(int(highest), HDR_HIGHEST), significant_figures)
+
+
+def decode_histogram(encoded):
+    if encoded.startswith(LOG_PREFIX):
+        return LogHistogram.decode(encoded)
+    if encoded.startswith(KLL_PREFIX):
+        return KllSketch.decode(encoded)
+    decoded = HdrHistogram.decode(encoded)
+    histogram = HdrBackend(decoded.lowest_trackable_value,
+                           decoded.highest_trackable_value,
+                           decoded.significant_figures)
+    histogram.add(decoded)
+    return histogram
+
+
+def merge_encoded(encodings):
+    # Histogram holding the values of all the encoded histograms, with the
+    # backend and precision of the first one. HdrHistograms can't add the
+    # values of a histogram with a wider range, so they start from the
+    # widest one.
+    histograms = [decode_histogram(encoded) for encoded in encodings]
+    if len(histograms) == 0:
+        return new_histogram()
+    histograms.sort(key=lambda h: getattr(h, 'highest_trackable_value', 0),
+                    reverse=True)
+    histogram = histograms[0]
+    for other in histograms[1:]:
+        histogram.add(other)
+    return histogram
+
+
+def recorded_buckets(histogram):
+    # Bounds, medians, counts and cumulative counts of the non empty buckets
+    lows, highs, medians, counts = histogram.buckets()
+    return lows, highs, medians, counts, np.cumsum(counts)
+
+
+def value_at_percentile(histogram, recorded, percentile):
+    # Same as HdrHistogram.get_value_at_percentile without walking all the
+    # buckets every time
+    lows, highs, medians, counts, cumulative = recorded
+    total = histogram.get_total_count()
+    if total == 0:
+        return 0
+    requested = min(percentile, 100.0)
+    target = max(int(requested * total / 100.0 + 0.5), 1)
+    index = int(np.searchsorted(cumulative, target))
+    if percentile:
+        return highs[index].item()
+    return lows[index].item()
+
+
+def percentile_info(histogram, percentiles=PERCENTILES, recorded=None):
+    # Distribution summary of a (possibly merged) histogram. A bucket counts
+    # as its median value for the mean and standard deviation, as in
+    # HdrHistogram, whose iterators don't work on python 2
+    if recorded is None:
+        recorded = recorded_buckets(histogram)
+    lows, highs, medians, counts, cumulative = recorded
+    total = histogram.get_total_count()
+
+    mean = 0.0
+    stddev = 0.0
+    if total != 0:
+        mean = float(np.dot(medians, counts) / total)
+        stddev = float(np.sqrt(np.dot((medians - mean) ** 2, counts) /
+                               total))
+
+    return {
+        'count': total,
+        'mean': mean,
+        'max': histogram.get_max_value(),
+        'stddev': stddev,
+        'percentiles': dict(('{:g}'.format(p),
+                             value_at_percentile(histogram, recorded, p))
+                            for p in percentiles)
+    }
+
+
+def merge_states(states, cores, encode=False, percentiles=PERCENTILES):
+    # Merge the per flow histograms and counters of several replications
+    info = []
+    for flow in range(len(states[0]['histograms'])):
+        histogram = merge_encoded(state['histograms'][flow]
+                                  for state in states)
+        dropped = sum(state['dropped'][flow] for state in states)
+        violations = sum(state['violations'][flow] for state in states)
+        info.append(flow_info(histogram, dropped, violations, cores,
+                              len(states), percentiles))
+        if encode:
+            info[-1]['histogram'] = histogram.encode()
+    return info
+
+
+def add_warmup(info, state):
+    # End of the warmup left out of a run, as reported with its results
+    if state.get('warmup') is not None:
+        for flow_info in info:
+            flow_info['warmup'] = state['warmup']
+
+
+# Points of the mean latency series MSER runs on over the simulation time
+MSER_POINTS = 1000
+
+# Columns of the per window series
+WINDOW_FIELDS = ['start', 'completed', 'throughput', 'goodput', 'dropped',
+                 'mean', 'p50', 'p99', 'max']
+
+
+class LatencyWindows(object):
+    """Summary of the latencies of one flow over consecutive intervals of
+    the simulation. Completions come in time order, so only the histogram
+    of the current interval is kept and every finished interval is reduced
+    to one row of WINDOW_FIELDS."""
+
+    def __init__(self, window, slo, histogram_args=(), keep=False,
+                 step=None):
+        self.window = window
+        self.slo = slo
+        self.histogram = new_histogram(*histogram_args)
+        self.current = 0
+        self.good = 0
+        self.rows = {}
+        self.drops = {}
+        # Encoded histogram of every interval, to summarize any of them again
+        self.encoded = {} if keep else None
+        # Sum and count of the latencies of every step, a finer series than
+        # the windows for MSER
+        self.step = step
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0)
+
+    def add_values(self, values, times):
+        if len(values) == 0:
+            return
+        if self.step:
+            steps = (times // self.step).astype(np.int64)
+            size = int(steps[-1]) + 1
+            if size > len(self.sums):
+                grow = np.zeros(size - len(self.sums))
+                self.sums = np.concatenate([self.sums, grow])
+                self.counts = np.concatenate([self.counts, grow])
+            self.sums[:size] += np.bincount(steps, values, size)
+            self.counts[:size] += np.bincount(steps, minlength=size)
+        indices = (times // self.window).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(indices)) + 1
+        for chunk, chunk_indices in zip(np.split(values, bounds),
+                                        np.split(indices, bounds)):
+            index = int(chunk_indices[0])
+            if index != self.current:
+                self.close()
+                self.current = index
+            if self.slo:
+                self.good += int(np.count_nonzero(chunk <= self.slo))
+            else:
+                self.good += len(chunk)
+            self.histogram.record_values(chunk)
+
+    def drop(self, time):
+        index = int(time // self.window)
+        self.drops[index] = self.drops.get(index, 0) + 1
+
+    def close(self):
+        completed = self.histogram.get_total_count()
+        if completed == 0:
+            return
+        info = percentile_info(self.histogram, [50, 99])
+        self.rows[self.current] = [
+            self.current * self.window, completed, completed / self.window,
+            self.good / self.window, 0, info['mean'],
+            info['percentiles']['50'], info['percentiles']['99'],
+            info['max']]
+        if self.encoded is not None:
+            self.encoded[self.current] = (self.histogram.encode(),
+                                          self.good)
+        self.histogram.reset()
+        self.good = 0
+
+    def series(self, num_windows):
+        # Intervals without completions or drops are left at zero
+        self.close()
+        series = np.zeros((num_windows, len(WINDOW_FIELDS)))
+        series[:, 0] = np.arange(num_windows) * self.window
+        for index, row in self.rows.items():
+            series[index] = row
+        for index, dropped in self.drops.items():
+            series[index, WINDOW_FIELDS.index('dropped')] = dropped
+        return series
+
+    def num_windows(self):
+        indices = list(self.rows.keys()) + list(self.drops.keys())
+        if self.histogram.get_total_count() != 0:
+            indices.append(self.current)
+        return max(indices) + 1 if indices else 0
+
+
+class BatchQuantiles(object):
+    """Sectioning confidence interval of a latency percentile of every flow.
+    The interval is centered on the percentile of all the latencies so far,
+    the one reported, and its width comes from the spread of the
+    percentiles of the batches the simulation is cut in. The mean of the
+    batch percentiles is biased for a high percentile of the whole run, so
+    it is only used for the width."""
+
+    def __init__(self, num_flows, percentile, histogram_args=()):
+        self.percentile = percentile
+        self.histogram_args = histogram_args
+        self.histograms = [new_histogram(*histogram_args)
+                           for i in range(num_flows)]
+        self.totals = [new_histogram(*histogram_args)
+                       for i in range(num_flows)]
+        self.dropped = [0 for i in range(num_flows)]
+        self.estimates = [[] for i in range(num_flows)]
+
+    def record_values(self, flow, values):
+        self.histograms[flow].record_values(values)
+        self.totals[flow].record_values(values)
+
+    def drop(self, flow):
+        self.dropped[flow] += 1
+
+    def estimate(self, flow):
+        # Percentile of the whole run so far, the dropped requests count as
+        # the maximum latency like in the summaries
+        histogram = self.totals[flow]
+        if self.dropped[flow] > 0:
+            histogram = new_histogram(*self.histogram_args)
+            histogram.add(self.totals[flow])
+            histogram.record_value(self.totals[flow].get_max_value(),
+                                   self.dropped[flow])
+        return value_at_percentile(histogram, recorded_buckets(histogram),
+                                   self.percentile)
+
+    def end_batch(self):
+        # Flows without completions in the batch don't get a sample
+        for histogram, estimates in zip(self.histograms, self.estimates):
+            if histogram.get_total_count() == 0:
+                continue
+            recorded = recorded_buckets(histogram)
+            estimates.append(value_at_percentile(histogram, recorded,
+                                                 self.percentile))
+            histogram.reset()
+
+    def intervals(self):
+        # Estimate, 95% confidence interval half width and number of batches
+        # of every flow
+        return [(self.estimate(flow), mean_interval(estimates)[1],
+                 len(estimates))
+                for flow, estimates in enumerate(self.estimates)]
+
+    def converged(self, target, min_batches):
+        # Whether each flow has enough batches and a half width within
+        # target times its estimate
+        return [batches >= min_batches and half_width <= target * abs(mean)
+                for mean, half_width, batches in self.intervals()]
 
 
 class Histogram(object):
 
     def __init__(self, num_histograms, cores, flow_config, opts):
-        self.histograms = [HdrHistogram(1, 1000 * 1000, 2)
+        # Backend of the histograms, with the sketches memory does not grow
+        # with the length of the run
+        histogram_args = (opts.histogram_backend, opts.precision,
+                          opts.sketch_size, float(opts.sim_time))
+        self.histograms = [new_histogram(*histogram_args)
                            for i in range(num_histograms)]
-        self.global_histogram = HdrHistogram(1, 1000 * 1000, 2)
+        self.percentiles = opts.percentiles
+        self.global_histogram = new_histogram(*histogram_args)
         self.cores = cores
         self.flow_config = flow_config
         self.violations = [0 for i in range(len(flow_config))]
         self.dropped = [0 for i in range(len(flow_config))]
-        self.print_values = opts.print_values
+        self.buffers = [[] for i in range(len(flow_config))]
+
+        # Per interval series and binary log, which need the completion time
+        # of every latency (env is set once the simulation environment
+        # exists)
+        self.env = None
+        self.histogram_args = histogram_args
+        self.windows = None
+        if opts.window or opts.warmup == 'mser':
+            # MSER runs on a series of MSER_POINTS points and the results
+            # are rebuilt from the histograms of the windows after the
+            # truncation, a hundredth of the simulation time long when there
+            # is no window length
+            window = float(opts.window or float(opts.sim_time) / 100)
+            step = None
+            if opts.warmup == 'mser':
+                step = min(window, float(opts.sim_time) / MSER_POINTS)
+            self.windows = [LatencyWindows(window, flow.get('slo'),
+                                           histogram_args,
+                                           opts.warmup == 'mser', step)
+                            for flow in flow_config]
+
+        # Latencies of requests completing before the warmup time are left
+        # out, the end of the warmup is found once the run is over with MSER
+        self.warmup = None
+        if opts.warmup is not None and opts.warmup != 'mser':
+            self.warmup = float(opts.warmup)
+        # Per batch percentiles when stopping once they are precise enough
+        self.batches = None
+        self.target_ci = opts.target_ci
+        self.min_batches = opts.min_batches
+        if opts.target_ci:
+            self.batches = BatchQuantiles(len(flow_config),
+                                          opts.target_percentile,
+                                          histogram_args)
+        self.stop_time = float(opts.sim_time)
+
+        self.log = None
+        if opts.print_values and opts.log_format == 'binary':
+            self.log = LatencyLogWriter(opts.output_file + '.lat')
+        self.timed = (self.windows is not None or self.log is not None or
+                      self.warmup is not None)
+        if self.timed:
+            self.times = [[] for i in range(len(flow_config))]
+            self.requests = [[] for i in range(len(flow_config))]
+            self.record_value = self.record_timed_value
+
+        self.print_values = opts.print_values and self.log is None
         if self.print_values:
             self.print_files = [open(opts.output_file + '_flow' + str(flow),
                                      'w+') for flow in range(len(flow_config))]
 
-    def record_value(self, flow, value):
-        self.global_histogram.record_value(value)
-        self.histograms[flow].record_value(value)
-        if self.flow_config[flow].get('slo'):
-            if value > self.flow_config[flow].get('slo'):
-                self.violations[flow] += 1
+    def record_value(self, flow, value, request=None):
+        buffer = self.buffers[flow]
+        buffer.append(value)
+        if len(buffer) >= BUFFER_SIZE:
+            self.flush(flow)
+
+    def record_timed_value(self, flow, value, request=None):
+        # record_value when keeping the per interval series or the log, or
+        # leaving out the warmup
+        self.times[flow].append(self.env.now)
+        self.requests[flow].append(request)
+        buffer = self.buffers[flow]
+        buffer.append(value)
+        if len(buffer) >= BUFFER_SIZE:
+            self.flush(flow)
+
+    def record_values(self, flow, values, times=None, indices=None):
+        # Bulk version of record_value for an array of latencies, the
+        # completion times and request ids are needed for the per interval
+        # series, the log and the warmup
+        self.flush(flow)
+        values = np.asarray(values, dtype=float)
         if self.print_values:
-            self.print_files[flow].write(str(value) + '\n')
+            self.print_files[flow].write(
+                ''.join(str(v) + '\n' for v in values.tolist()))
+        if not self.timed:
+            self.add_values(flow, values)
+            return
 
-    def print_info(self):
+        times = np.asarray(times, dtype=float)
+        self.add_values(flow, values, times)
+        order = np.argsort(times, kind='mergesort')
+        values = values[order]
+        times = times[order]
+        if self.log is not None:
+            self.log.write(np.asarray(indices)[order], flow, times - values,
+                           times)
+        if self.windows is not None:
+            self.windows[flow].add_values(values, times)
+
+    def close_outputs(self):
+        # Write out the buffered latencies and close the files they are
+        # printed or logged to, a run in the calling process can read them
+        # right after
+        self.flush()
+        if self.print_values:
+            for print_file in self.print_files:
+                print_file.close()
+            self.print_values = False
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def flush(self, flow=None):
+        flows = range(len(self.buffers)) if flow is None else [flow]
+        for flow in flows:
+            buffer = self.buffers[flow]
+            if len(buffer) == 0:
+                continue
+            self.buffers[flow] = []
+            if self.print_values:
+                self.print_files[flow].write(
+                    ''.join(str(v) + '\n' for v in buffer))
+            values = np.array(buffer, dtype=float)
+            if not self.timed:
+                self.add_values(flow, values)
+                continue
+
+            times = np.array(self.times[flow], dtype=float)
+            self.add_values(flow, values, times)
+            requests = self.requests[flow]
+            self.times[flow] = []
+            self.requests[flow] = []
+            if self.log is not None:
+                self.log.write([r.idx for r in requests], flow,
+                               [r.start_time for r in requests], times)
+            if self.windows is not None:
+                self.windows[flow].add_values(values, times)
+        if self.log is not None:
+            self.log.flush()
+
+    def add_values(self, flow, values, times=None):
+        if self.warmup is not None:
+            values = values[times >= self.warmup]
+        slo = self.flow_config[flow].get('slo')
+        if slo:
+            self.violations[flow] += int(np.count_nonzero(values > slo))
+        self.histograms[flow].record_values(values)
+        self.global_histogram.record_values(values)
+        if self.batches is not None:
+            self.batches.record_values(flow, values)
+
+    def get_info(self):
+        self.flush()
         info = []
         for i in range(len(self.histograms)):
             # Add the dropped requests as max time
-            max_value = self.histograms[i].get_max_value()
-            for j in range(self.dropped[i]):
-                self.histograms[i].record_value(max_value)
-
-            # Get the total count of received requests
-            total_count = self.histograms[i].get_total_count()
-
-            # Get the 99th latency
-            latency = self.histograms[i].get_value_at_percentile(99)
-
-            # Prepare the json for output
-            new_value = {
-                'latency': latency,
-                'per_core_through': (1.0 * (total_count - self.dropped[i]) /
-                                     self.cores),
-                'slo_success': 1.0 - (1.0 * self.violations[i] / total_count),
-                'dropped_requests': self.dropped[i]
-            }
-            info.append(new_value)
-        print json.dumps(info)
+            if self.dropped[i] > 0:
+                max_value = self.histograms[i].get_max_value()
+                self.histograms[i].record_value(max_value, self.dropped[i])
+
+            info.append(flow_info(self.histograms[i], self.dropped[i],
+                                  self.violations[i], self.cores, 1,
+                                  self.percentiles))
+        return info
+
+    def print_info(self):
+        print json.dumps(self.get_info())
+
+    def get_state(self):
+        # Everything needed to merge this run with other replications
+        self.flush()
+        state = {
+            'histograms': [h.encode() for h in self.histograms],
+            'violations': list(self.violations),
+            'dropped': list(self.dropped)
+        }
+        if self.warmup is not None:
+            state['warmup'] = self.warmup
+        return state
+
+    def detect_warmup(self):
+        # Leave out the windows before the MSER-5 truncation point of the
+        # mean latency series of the slowest flow to settle, rounded up to
+        # the end of its window
+        self.flush()
+        truncations = []
+        for flow, windows in enumerate(self.windows):
+            means = windows.sums / np.maximum(windows.counts, 1)
+            start, settled = mser(means, windows.counts)
+            if not settled:
+                logging.warning('Run too short for flow {} to settle, MSER'
+                                ' truncates half of it'.format(flow))
+            truncations.append(start * windows.step)
+        window = self.windows[0].window
+        start = int(np.ceil(max(truncations) / window))
+        self.warmup = start * window
+
+        self.global_histogram.reset()
+        for flow, windows in enumerate(self.windows):
+            kept = [windows.encoded[i] for i in sorted(windows.encoded)
+                    if i >= start]
+            histogram = new_histogram(*self.histogram_args)
+            for encoded, good in kept:
+                histogram.add(decode_histogram(encoded))
+            self.histograms[flow] = histogram
+            self.global_histogram.add(histogram)
+            self.dropped[flow] = sum(count for i, count in
+                                     windows.drops.items() if i >= start)
+            self.violations[flow] = (self.dropped[flow] +
+                                     histogram.get_total_count() -
+                                     sum(good for encoded, good in kept))
+        logging.info('Warmup ends at {}'.format(self.warmup))
+
+    def end_batch(self):
+        # All the latencies recorded so far belong to the batch that ends
+        self.flush()
+        self.batches.end_batch()
+
+    def converged(self):
+        return all(self.batches.converged(self.target_ci, self.min_batches))
+
+    def get_convergence(self):
+        # Precision reached by the percentile of every flow
+        convergence = []
+        converged = self.batches.converged(self.target_ci, self.min_batches)
+        for (mean, half_width, batches), done in zip(
+                self.batches.intervals(), converged):
+            # No interval without at least two batches
+            if not np.isfinite(half_width):
+                half_width = None
+            convergence.append({
+                'ci_percentile': self.batches.percentile,
+                'ci_estimate': mean,
+                'ci_half_width': half_width,
+                'ci_relative': (half_width / abs(mean)
+                                if half_width is not None and mean else None),
+                'ci_batches': batches,
+                'converged': done,
+                'stop_time': self.stop_time
+            })
+        return convergence
+
+    def get_windows(self):
+        # Array of (flow, interval, WINDOW_FIELDS) with the per interval
+        # series of every flow
+        self.flush()
+        num_windows = max(w.num_windows() for w in self.windows)
+        return np.array([w.series(num_windows) for w in self.windows])
 
     def drop_request(self, flow_id):
-        self.dropped[flow_id] += 1
-        self.violations[flow_id] += 1
+        if self.warmup is None or self.env.now >= self.warmup:
+            self.dropped[flow_id] += 1
+            self.violations[flow_id] += 1
+            if self.batches is not None:
+                self.batches.drop(flow_id)
+        if self.windows is not None:
+            self.windows[flow_id].drop(self.env.now)
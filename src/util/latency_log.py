@@ -0,0 +1,103 @@
+import numpy as np
+
+# One fixed width record per completed request
+RECORD = np.dtype([('idx', '<i8'), ('flow', '<i4'), ('start', '<f8'),
+                   ('completion', '<f8')])
+
+# Records read at once by the queries
+CHUNK_SIZE = 1 << 20
+
+
+class LatencyLogWriter(object):
+    """Appends request records to a binary file through a large buffer."""
+
+    def __init__(self, path, buffer_size=1 << 22):
+        self.f = open(path, 'wb', buffer_size)
+
+    def write(self, idx, flow, start, completion):
+        records = np.empty(len(idx), dtype=RECORD)
+        records['idx'] = idx
+        records['flow'] = flow
+        records['start'] = start
+        records['completion'] = completion
+        records.tofile(self.f)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def read_log(path):
+    # The records are only read from disk when they are accessed
+    return np.memmap(path, dtype=RECORD, mode='r')
+
+
+def flow_latencies(log, flow, chunk_size=CHUNK_SIZE):
+    # Latencies of a flow, one chunk of the log at a time
+    for begin in range(0, len(log), chunk_size):
+        chunk = log[begin:begin + chunk_size]
+        chunk = chunk[chunk['flow'] == flow]
+        yield chunk['completion'] - chunk['start']
+
+
+def latency_cdf(log, flow, values, chunk_size=CHUNK_SIZE):
+    # Fraction of the requests of a flow with a latency up to each value
+    values = np.asarray(values, dtype=float)
+    below = np.zeros(len(values), dtype=np.int64)
+    total = 0
+    for latencies in flow_latencies(log, flow, chunk_size):
+        latencies.sort()
+        below += np.searchsorted(latencies, values, side='right')
+        total += len(latencies)
+    if total == 0:
+        return np.zeros(len(values))
+    return below / float(total)
+
+
+def latency_percentiles(log, flow, percentiles, bins=4096,
+                        chunk_size=CHUNK_SIZE):
+    """Exact nearest rank percentiles of the latencies of a flow. A first
+    pass counts the latencies in bins and a second one keeps only the
+    latencies of the bins holding the requested ranks, so memory does not
+    grow with the size of the log."""
+    total = 0
+    low = np.inf
+    high = -np.inf
+    for latencies in flow_latencies(log, flow, chunk_size):
+        if len(latencies) == 0:
+            continue
+        total += len(latencies)
+        low = min(low, latencies.min())
+        high = max(high, latencies.max())
+    if total == 0:
+        return [0.0 for p in percentiles]
+
+    edges = np.linspace(low, high, bins + 1)
+
+    def bin_of(latencies):
+        # The last bin includes high
+        return np.clip(np.searchsorted(edges, latencies, side='right') - 1,
+                       0, bins - 1)
+
+    counts = np.zeros(bins, dtype=np.int64)
+    for latencies in flow_latencies(log, flow, chunk_size):
+        counts += np.bincount(bin_of(latencies), minlength=bins)
+    cumulative = np.cumsum(counts)
+
+    # Bin and rank within the bin of every percentile
+    ranks = [max(int(np.ceil(p / 100.0 * total)), 1) for p in percentiles]
+    targets = [int(np.searchsorted(cumulative, r)) for r in ranks]
+    selected = dict((b, []) for b in targets)
+    for latencies in flow_latencies(log, flow, chunk_size):
+        latency_bins = bin_of(latencies)
+        for b in selected:
+            selected[b].append(latencies[latency_bins == b])
+
+    values = []
+    for rank, b in zip(ranks, targets):
+        in_bin = np.sort(np.concatenate(selected[b]))
+        before = cumulative[b - 1] if b > 0 else 0
+        values.append(float(in_bin[rank - before - 1]))
+    return values
@@ -0,0 +1,153 @@
+import math
+import json
+import zlib
+import base64
+import numpy as np
+
+# Prefix telling these encodings apart from the HdrHistogram ones
+ENCODING_PREFIX = 'loghist:'
+
+
+class LogHistogram(object):
+    """Log-linear bucketed histogram kept in a NumPy array. Every power of
+    two is split in sub_buckets linear buckets, enough for the requested
+    significant digits, and the array grows to cover any positive value
+    instead of being limited to a fixed range. Values are not truncated to
+    integers, zeros have their own bucket."""
+
+    def __init__(self, significant_figures=2):
+        self.significant_figures = significant_figures
+        self.sub_buckets = 1 << int(math.ceil(
+            math.log(10 ** significant_figures, 2)))
+        self.min_exponent = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.total_count = 0
+        self.min_value = float('inf')
+        self.max_value = 0.0
+
+    def bucket_indices(self, values):
+        # values = m * 2^e with m in [0.5, 1), so 2m - 1 is the exact
+        # position within the power of two
+        mantissas, exponents = np.frexp(values)
+        subs = ((2 * mantissas - 1) * self.sub_buckets).astype(np.int64)
+        return exponents.astype(np.int64), subs
+
+    def extend(self, min_exponent, max_exponent):
+        # Grow the counts array to cover [min_exponent, max_exponent]
+        if len(self.counts) == 0:
+            self.min_exponent = min_exponent
+            self.counts = np.zeros((max_exponent - min_exponent + 1) *
+                                   self.sub_buckets, dtype=np.int64)
+            return
+        current_max = (self.min_exponent +
+                       len(self.counts) // self.sub_buckets - 1)
+        low = min(min_exponent, self.min_exponent)
+        high = max(max_exponent, current_max)
+        if low == self.min_exponent and high == current_max:
+            return
+        counts = np.zeros((high - low + 1) * self.sub_buckets,
+                          dtype=np.int64)
+        offset = (self.min_exponent - low) * self.sub_buckets
+        counts[offset:offset + len(self.counts)] = self.counts
+        self.min_exponent = low
+        self.counts = counts
+
+    def record_values(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        self.total_count += len(values)
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        exponents, subs = self.bucket_indices(positive)
+        self.extend(int(exponents.min()), int(exponents.max()))
+        indices = (exponents - self.min_exponent) * self.sub_buckets + subs
+        self.counts += np.bincount(indices, minlength=len(self.counts))
+
+    def record_value(self, value, count=1):
+        self.record_values(np.full(count, value, dtype=float))
+
+    def get_total_count(self):
+        return self.total_count
+
+    def get_max_value(self):
+        return self.max_value
+
+    def buckets(self):
+        # Lowest value, highest value, midpoint and count of the non empty
+        # buckets in increasing order
+        indices = np.flatnonzero(self.counts)
+        exponents = self.min_exponent + indices // self.sub_buckets
+        subs = indices % self.sub_buckets
+        scale = np.ldexp(1.0, exponents - 1) / self.sub_buckets
+        lows = (self.sub_buckets + subs) * scale
+        highs = np.minimum(lows + scale, self.max_value)
+        counts = self.counts[indices]
+        if self.zero_count:
+            lows = np.concatenate([[0.0], lows])
+            highs = np.concatenate([[0.0], highs])
+            counts = np.concatenate([[self.zero_count], counts])
+        return lows, highs, (lows + highs) / 2, counts
+
+    def add(self, other):
+        if other.sub_buckets != self.sub_buckets:
+            raise ValueError('Cannot add histograms with different'
+                             ' precisions')
+        self.total_count += other.total_count
+        self.zero_count += other.zero_count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        if len(other.counts) == 0:
+            return
+        other_max = (other.min_exponent +
+                     len(other.counts) // other.sub_buckets - 1)
+        self.extend(other.min_exponent, other_max)
+        offset = (other.min_exponent - self.min_exponent) * self.sub_buckets
+        self.counts[offset:offset + len(other.counts)] += other.counts
+
+    def encode(self):
+        indices = np.flatnonzero(self.counts)
+        payload = {
+            'significant_figures': self.significant_figures,
+            'min_exponent': self.min_exponent,
+            'length': len(self.counts),
+            'indices': indices.tolist(),
+            'counts': self.counts[indices].tolist(),
+            'zero_count': self.zero_count,
+            'total_count': self.total_count,
+            'min_value': self.min_value if self.total_count else None,
+            'max_value': self.max_value
+        }
+        return ENCODING_PREFIX + base64.b64encode(
+            zlib.compress(json.dumps(payload)))
+
+    @staticmethod
+    def decode(encoded):
+        payload = json.loads(zlib.decompress(base64.b64decode(
+            encoded[len(ENCODING_PREFIX):])))
+        histogram = LogHistogram(payload['significant_figures'])
+        histogram.min_exponent = payload['min_exponent']
+        histogram.counts = np.zeros(payload['length'], dtype=np.int64)
+        histogram.counts[payload['indices']] = payload['counts']
+        histogram.zero_count = payload['zero_count']
+        histogram.total_count = payload['total_count']
+        if payload['min_value'] is not None:
+            histogram.min_value = payload['min_value']
+        histogram.max_value = payload['max_value']
+        return histogram
+
+    def decode_and_add(self, encoded):
+        self.add(LogHistogram.decode(encoded))
+
+    def reset(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.total_count = 0
+        self.min_value = float('inf')
+        self.max_value = 0.0
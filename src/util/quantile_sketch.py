@@ -0,0 +1,131 @@
+import json
+import zlib
+import base64
+import numpy as np
+
+# Prefix telling these encodings apart from the histogram ones
+ENCODING_PREFIX = 'kll:'
+
+# Capacity ratio between a level and the one above it
+CAPACITY_RATIO = 2.0 / 3.0
+
+
+class KllSketch(object):
+    """KLL streaming quantile sketch. Level h keeps items that stand for 2^h
+    values each, and a full level is sorted and every other item (starting
+    at a random offset) moves up a level. Memory stays around 3 * size items
+    whatever the number of values, and the rank error is about 1.7 / size
+    of the count. Sketches of the same size can be merged."""
+
+    def __init__(self, size=200, seed=0):
+        self.size = size
+        self.levels = [np.zeros(0)]
+        self.total_count = 0
+        self.min_value = float('inf')
+        self.max_value = 0.0
+        # Own generator so that the sketch does not change the simulation
+        self.random = np.random.RandomState(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.size * CAPACITY_RATIO ** depth)))
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                # An odd item out stays at this level so no weight is lost
+                items = np.sort(items)
+                kept = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                promoted = items[self.random.randint(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted])
+                # Growing the levels lowers the capacity of the lower ones
+                level = 0
+            else:
+                level += 1
+
+    def record_values(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        self.total_count += len(values)
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def record_value(self, value, count=1):
+        self.record_values(np.full(count, value, dtype=float))
+
+    def get_total_count(self):
+        return self.total_count
+
+    def get_max_value(self):
+        return self.max_value
+
+    def buckets(self):
+        # Retained items and their weights in increasing order, the lowest
+        # and highest ones are the exact minimum and maximum
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 1 << level,
+                                          dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='mergesort')
+        values = values[order]
+        lows = values.copy()
+        highs = values.copy()
+        if len(values):
+            lows[0] = self.min_value
+            highs[-1] = self.max_value
+        return lows, highs, values, weights[order]
+
+    def add(self, other):
+        if other.size != self.size:
+            raise ValueError('Cannot add sketches with different sizes')
+        self.total_count += other.total_count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compress()
+
+    def encode(self):
+        payload = {
+            'size': self.size,
+            'levels': [items.tolist() for items in self.levels],
+            'total_count': self.total_count,
+            'min_value': self.min_value if self.total_count else None,
+            'max_value': self.max_value
+        }
+        return ENCODING_PREFIX + base64.b64encode(
+            zlib.compress(json.dumps(payload)))
+
+    @staticmethod
+    def decode(encoded):
+        payload = json.loads(zlib.decompress(base64.b64decode(
+            encoded[len(ENCODING_PREFIX):])))
+        sketch = KllSketch(payload['size'])
+        sketch.levels = [np.array(items, dtype=float)
+                         for items in payload['levels']]
+        sketch.total_count = payload['total_count']
+        if payload['min_value'] is not None:
+            sketch.min_value = payload['min_value']
+        sketch.max_value = payload['max_value']
+        return sketch
+
+    def decode_and_add(self, encoded):
+        self.add(KllSketch.decode(encoded))
+
+    def reset(self):
+        self.levels = [np.zeros(0)]
+        self.total_count = 0
+        self.min_value = float('inf')
+        self.max_value = 0.0
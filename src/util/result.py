@@ -0,0 +1,68 @@
+import numpy as np
+
+from util.histogram import (merge_states, decode_histogram, PERCENTILES,
+                            WINDOW_FIELDS)
+
+
+class Result(object):
+    """Results of a simulation as returned by sim.simulate. flows holds the
+    summary of every flow as printed by sim.py, state the encoded histograms
+    and counters that replications are merged from, and runs the result of
+    every seed when there are several."""
+
+    def __init__(self, flows, state, cores, runs=None):
+        self.flows = flows
+        self.state = state
+        self.cores = cores
+        self.runs = runs
+
+    @staticmethod
+    def merge(results, percentiles=PERCENTILES):
+        # Replications of the same configuration with different seeds
+        states = [r.state for r in results]
+        flows = merge_states(states, float(results[0].cores), True,
+                             percentiles)
+        state = {
+            'histograms': [flow.pop('histogram') for flow in flows],
+            'violations': [sum(s['violations'][i] for s in states)
+                           for i in range(len(flows))],
+            'dropped': [sum(s['dropped'][i] for s in states)
+                        for i in range(len(flows))]
+        }
+        return Result(flows, state, results[0].cores, list(results))
+
+    def num_flows(self):
+        return len(self.flows)
+
+    def field(self, name):
+        # Array of one summary field (latency, slo_success...) of every flow
+        return np.array([flow.get(name) for flow in self.flows])
+
+    def percentiles(self, percentiles):
+        # Array of (flow, percentile) latencies, dropped requests count as
+        # the maximum latency like in the summaries
+        flows = merge_states([self.state], float(self.cores),
+                             percentiles=percentiles)
+        return np.array([[flow['percentiles']['{:g}'.format(p)]
+                          for p in percentiles] for flow in flows])
+
+    def histogram(self, flow):
+        # Latency histogram of a flow, without the dropped requests
+        return decode_histogram(self.state['histograms'][flow])
+
+    def windows(self):
+        # Array of (flow, interval, WINDOW_FIELDS) when the run kept the per
+        # interval series
+        if any('windows' not in flow for flow in self.flows):
+            return None
+        return np.array([[flow['windows'][field] for field in WINDOW_FIELDS]
+                         for flow in self.flows]).transpose(0, 2, 1)
+
+    def to_json(self):
+        # Same output as sim.py
+        if self.runs is None:
+            return self.flows
+        return {
+            'runs': [run.flows for run in self.runs],
+            'merged': self.flows
+        }
@@ -0,0 +1,183 @@
+import os
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_sim_version = None
+
+# Entries written between two walks over the whole cache. Other processes
+# sharing the cache are only seen by the walks, in between the size is an
+# estimate.
+EVICT_INTERVAL = 100
+
+# Fraction of the maximum size an eviction brings the cache down to
+EVICT_TARGET = 0.9
+
+# Caches already opened by this process, keyed by directory and size
+_caches = {}
+
+
+def sim_version():
+    # Any change to the simulator sources invalidates the cached results
+    global _sim_version
+    if _sim_version is None:
+        digest = hashlib.sha1()
+        for root, dirs, files in sorted(os.walk(SRC_DIR)):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith('.py'):
+                    continue
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, SRC_DIR))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _sim_version = digest.hexdigest()
+    return _sim_version
+
+
+def normalize(value):
+    # 1 and 1.0 (or "1" from the command line) give the same simulation
+    if isinstance(value, dict):
+        return dict((k, normalize(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def run_key(flow_config, host_type, cores, network_cores, deq_cost,
+            queue_policy, seed, sim_time, engine, histogram_backend='hdr',
+            precision=2, sketch_size=200, warmup=None, window=None):
+    # simpy and the heap engine produce the same results
+    params = {
+        'flow_config': normalize(flow_config),
+        'host_type': host_type,
+        'cores': int(cores),
+        'network_cores': int(network_cores),
+        'deq_cost': float(deq_cost),
+        'queue_policy': queue_policy,
+        'seed': int(seed),
+        'sim_time': float(sim_time),
+        'engine': 'vector' if engine == 'vector' else 'event',
+        'version': sim_version()
+    }
+    # Only non default histograms are part of the key
+    if histogram_backend == 'kll':
+        params['histogram'] = [histogram_backend, int(sketch_size)]
+    elif histogram_backend != 'hdr' or int(precision) != 2:
+        params['histogram'] = [histogram_backend, int(precision)]
+    # MSER depends on the intervals it looks at
+    if warmup == 'mser':
+        params['warmup'] = ['mser', float(window or float(sim_time) / 100)]
+    elif warmup is not None:
+        params['warmup'] = float(warmup)
+    return hashlib.sha1(json.dumps(params, sort_keys=True)).hexdigest()
+
+
+def opts_key(opts, flow_config):
+    return run_key(flow_config, opts.host_type, opts.cores,
+                   opts.network_cores, opts.deq_cost, opts.queue_policy,
+                   opts.seed, opts.sim_time, opts.engine,
+                   opts.histogram_backend, opts.precision, opts.sketch_size,
+                   opts.warmup, opts.window)
+
+
+def open_cache(path, max_size):
+    # Same cache for all the runs of a process, so that they share the
+    # running size
+    if (path, max_size) not in _caches:
+        _caches[(path, max_size)] = ResultCache(path, max_size)
+    return _caches[(path, max_size)]
+
+
+class ResultCache(object):
+    """Results of previous runs stored under the hash of everything that
+    determines them. When the directory grows past max_size bytes the least
+    recently used entries are removed. The size of the directory is kept up
+    to date as entries are written and only counted again every
+    EVICT_INTERVAL entries or when it seems to be over max_size."""
+
+    def __init__(self, path, max_size=1024 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.size = None
+        self.puts = 0
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        logging.debug('ResultCache: Hit {}'.format(key))
+        return result
+
+    def put(self, key, result):
+        path = self.entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Write and rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+            size = f.tell()
+        os.rename(tmp_path, path)
+
+        self.puts += 1
+        if (self.size is None or self.puts >= EVICT_INTERVAL or
+                self.size + size > self.max_size):
+            self.evict()
+        else:
+            self.size += size
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        # Once over max_size, leave room for a few entries before the next
+        # eviction
+        entries.sort()
+        target = self.max_size
+        if total > self.max_size:
+            target = self.max_size * EVICT_TARGET
+        for mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            logging.debug('ResultCache: Evicted {}'.format(path))
+        self.size = total
+        self.puts = 0
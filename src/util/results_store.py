@@ -0,0 +1,163 @@
+import os
+import tempfile
+import numpy as np
+
+# Appended rows go to numbered chunk files in this directory next to the
+# store until they are compacted into it
+CHUNK_SUFFIX = '.chunks'
+
+
+def column_array(values):
+    # Numbers become float columns with NaN for the missing values (int
+    # columns when none is missing), everything else a string column
+    present = [v for v in values if v is not None]
+    complete = len(present) == len(values)
+    if complete and all(isinstance(v, bool) for v in present):
+        return np.array(values, dtype=bool)
+    if all(isinstance(v, (int, long, float)) and not isinstance(v, bool)
+           for v in present):
+        if complete and all(isinstance(v, (int, long)) for v in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in values],
+                        dtype=np.float64)
+    return np.array(['' if v is None else str(v) for v in values])
+
+
+def column_values(array):
+    # Inverse of column_array, missing values come back as None
+    values = array.tolist()
+    if array.dtype.kind == 'f':
+        return [None if v != v else v for v in values]
+    if array.dtype.kind in 'SU':
+        return [v if v != '' else None for v in values]
+    return values
+
+
+def mean_by(columns, by, value):
+    # Mean of a column for every distinct value of another one
+    keys = np.unique(columns[by])
+    means = [float(np.nanmean(columns[value][columns[by] == key]))
+             for key in keys]
+    return keys.tolist(), means
+
+
+def read_columns(path):
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
+def column_rows(columns):
+    if not columns:
+        return []
+    names = sorted(columns.keys())
+    values = [column_values(columns[name]) for name in names]
+    rows = []
+    for row in zip(*values):
+        rows.append(dict((name, v) for name, v in zip(names, row)
+                         if v is not None))
+    return rows
+
+
+def row_columns(rows):
+    names = set()
+    for row in rows:
+        names.update(row.keys())
+    return dict((name, column_array([row.get(name) for row in rows]))
+                for name in names)
+
+
+def write_columns(path, columns):
+    # Write and rename so readers never see a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **columns)
+    os.rename(tmp_path, path)
+
+
+class ResultsStore(object):
+    """Results of a sweep kept as one row per run in a single .npz file with
+    a typed array per column. Flow parameters and results are stored in
+    flow<k>_<name> columns. Appending only writes the new rows to a chunk
+    file, so that a sweep can save every point as soon as it is done, and
+    compact() merges the chunks into the store. Readers see the chunks
+    either way, a run in a later chunk replacing the same one before it."""
+
+    def __init__(self, path, key=('name', 'seed')):
+        self.path = path
+        self.key = key
+
+    def chunk_paths(self):
+        directory = self.path + CHUNK_SUFFIX
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))
+                if name.endswith('.npz') and name[0].isdigit()]
+
+    def load(self):
+        if not self.chunk_paths():
+            return read_columns(self.path)
+        return row_columns(self.rows())
+
+    def rows(self):
+        rows = column_rows(read_columns(self.path))
+        chunks = self.chunk_paths()
+        if not chunks:
+            return rows
+
+        # Later runs replace the earlier ones with the same key
+        for path in chunks:
+            new_rows = column_rows(read_columns(path))
+            new_keys = set(self.row_key(row) for row in new_rows)
+            rows = [row for row in rows if self.row_key(row) not in new_keys]
+            rows += new_rows
+        return rows
+
+    def row_key(self, row):
+        return tuple(row.get(k) for k in self.key)
+
+    def append(self, new_rows):
+        # The new rows go to the next chunk, a run that is already in the
+        # store is replaced
+        if not new_rows:
+            return
+        directory = self.path + CHUNK_SUFFIX
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        chunks = self.chunk_paths()
+        number = 0
+        if chunks:
+            number = int(os.path.basename(chunks[-1]).split('.')[0]) + 1
+        write_columns(os.path.join(directory, '{:08d}.npz'.format(number)),
+                      row_columns(new_rows))
+
+    def compact(self):
+        # Merge the chunks into the store file
+        chunks = self.chunk_paths()
+        if not chunks:
+            return
+        write_columns(self.path, row_columns(self.rows()))
+        for path in chunks:
+            os.remove(path)
+        try:
+            os.rmdir(self.path + CHUNK_SUFFIX)
+        except OSError:
+            pass
+
+    def query(self, **conditions):
+        # Columns of the rows whose columns match the given values, floats
+        # are compared with a tolerance
+        columns = self.load()
+        if not columns:
+            return columns
+        mask = np.ones(len(next(iter(columns.values()))), dtype=bool)
+        for name, value in conditions.items():
+            column = columns[name]
+            if column.dtype.kind == 'f':
+                mask &= np.isclose(column, value)
+            else:
+                mask &= column == value
+        return dict((name, column[mask]) for name, column in columns.items())
@@ -0,0 +1,95 @@
+import math
+import numpy as np
+
+# Two sided 95% quantile of the standard normal distribution
+Z_95 = 1.959963984540054
+
+# Groups of batch means the variance of the MSER truncation test comes from
+MSER_GROUPS = 20
+
+
+def t_quantile(df, z=Z_95):
+    # Quantile of Student's t distribution matching the normal quantile z,
+    # exact for 1 and 2 degrees of freedom and from the Cornish-Fisher
+    # expansion (within 0.3% from 4 degrees of freedom on) otherwise
+    if df <= 2:
+        p = 0.5 * (1 + math.erf(z / math.sqrt(2)))
+        if df == 1:
+            return math.tan(math.pi * (p - 0.5))
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    g1 = (z ** 3 + z) / 4.0
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96.0
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384.0
+    df = float(df)
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3
+
+
+def mean_interval(samples):
+    # Mean and half width of the 95% confidence interval of the mean of
+    # independent samples
+    samples = np.asarray(samples, dtype=float)
+    n = len(samples)
+    if n == 0:
+        return 0.0, float('inf')
+    mean = float(samples.mean())
+    if n < 2:
+        return mean, float('inf')
+    half_width = (t_quantile(n - 1) * float(samples.std(ddof=1)) /
+                  math.sqrt(n))
+    return mean, half_width
+
+
+def mser(series, weights=None, batch_size=5):
+    """MSER-m truncation point of an output series: the series is averaged
+    over batches of batch_size points and the truncation is the number of
+    leading batches minimizing the squared standard error of the mean of
+    the remaining ones, searched over the first half of the batches only.
+    Points are weighted (by their number of observations) when weights are
+    given and batches without any weight are left out. The truncation is
+    only kept when the mean of the batches it leaves out is outside the 95%
+    confidence interval of their difference with the mean of the others.
+    Returns the index of the first point kept and whether the truncation
+    stopped before the half of the batches, beyond which the series is too
+    short to tell the end of the warmup."""
+    series = np.asarray(series, dtype=float)
+    if weights is None:
+        weights = np.ones(len(series))
+    weights = np.asarray(weights, dtype=float)
+    num_batches = len(series) // batch_size
+    if num_batches < 2:
+        return 0, True
+
+    # Weighted batch means and the index of the first point of each batch
+    length = num_batches * batch_size
+    sums = (np.nan_to_num(series[:length]) * weights[:length]).reshape(
+        num_batches, batch_size).sum(axis=1)
+    totals = weights[:length].reshape(num_batches, batch_size).sum(axis=1)
+    present = totals > 0
+    means = sums[present] / totals[present]
+    starts = np.flatnonzero(present) * batch_size
+    if len(means) < 2:
+        return 0, True
+
+    # Sums of the batch means and their squares from every batch on
+    n = len(means)
+    remaining = np.arange(n, 0, -1, dtype=float)
+    tail_sum = np.cumsum(means[::-1])[::-1]
+    tail_squares = np.cumsum(means[::-1] ** 2)[::-1]
+    deviations = tail_squares - tail_sum ** 2 / remaining
+    statistic = deviations / remaining ** 2
+    truncation = int(np.argmin(statistic[:n // 2 + 1]))
+    if truncation == 0:
+        return 0, True
+
+    # Noise alone makes the minimum fall after the first batch now and then,
+    # the variance of a batch mean is that of a stationary series, taken
+    # from groups of batches to allow for their correlation
+    group = max(n // MSER_GROUPS, 1)
+    groups = means[:n // group * group].reshape(-1, group).mean(axis=1)
+    variance = groups.var(ddof=1) * group
+    kept = means[truncation:]
+    difference = abs(means[:truncation].mean() - kept.mean())
+    if difference <= Z_95 * math.sqrt(variance / truncation +
+                                      variance / len(kept)):
+        return 0, True
+    return int(starts[truncation]), truncation < n // 2
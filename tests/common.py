@@ -0,0 +1,83 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+
+from sim import simulate  # noqa: E402
+
+SIM_TIME = 10000
+SEED = 7
+
+# Plain FCFS flows, the only ones the vector engine computes
+FCFS_FLOWS = [
+    {"app_gen": "lognormal", "network_gen": "fixed",
+     "inter_gen": "exponential", "app_mean": 5.0, "std_dev_app": 10.0,
+     "network_time": 0.0, "load": 0.45, "time_slice": 0.0,
+     "enq_front": False, "slo": 50},
+    {"app_gen": "fixed", "network_gen": "fixed", "inter_gen": "exponential",
+     "app_time": 2.0, "network_time": 0.0, "load": 0.45, "time_slice": 0.0,
+     "enq_front": False, "slo": 10}
+]
+
+# Preempted every time slice
+SLICED_FLOWS = [
+    {"app_gen": "lognormal", "network_gen": "fixed",
+     "inter_gen": "exponential", "app_mean": 5.0, "std_dev_app": 10.0,
+     "network_time": 0.0, "load": 0.45, "time_slice": 2.0,
+     "enq_front": False, "slo": 50, "preemption": 0.1},
+    {"app_gen": "fixed", "network_gen": "fixed", "inter_gen": "exponential",
+     "app_time": 3.0, "network_time": 0.5, "load": 0.45, "time_slice": 0.5,
+     "enq_front": True, "slo": 10, "preemption": 0.0}
+]
+
+# With network processing times, for the mixed and partitioned hosts
+NETWORK_FLOWS = [
+    {"app_gen": "lognormal", "network_gen": "lognormal",
+     "inter_gen": "exponential", "app_mean": 5.0, "std_dev_app": 10.0,
+     "network_mean": 1.0, "std_dev_network": 2.0, "network_time": 0.0,
+     "load": 0.45, "time_slice": 0.0, "enq_front": False, "slo": 50},
+    {"app_gen": "fixed", "network_gen": "lognormal",
+     "inter_gen": "exponential", "app_time": 2.0, "network_mean": 1.0,
+     "std_dev_network": 2.0, "network_time": 0.0, "load": 0.45,
+     "time_slice": 0.0, "enq_front": False, "slo": 10}
+]
+
+
+class SimulationTest(unittest.TestCase):
+    """Runs simulations in a temporary directory, with the latencies of
+    every request printed to files."""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def run_latencies(self, flows, name='run', **options):
+        # Result of the run and the latency of every request of every flow,
+        # in completion order
+        options.setdefault('seed', SEED)
+        options.setdefault('sim_time', SIM_TIME)
+        output_file = self.path(name)
+        result = simulate(flows, print_values=True, output_file=output_file,
+                          **options)
+        latencies = [np.loadtxt(output_file + '_flow' + str(flow), ndmin=1)
+                     for flow in range(len(flows))]
+        return result, latencies
+
+    def assert_same_latencies(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for flow, (a, b) in enumerate(zip(expected, actual)):
+            self.assertTrue(len(a) > 0)
+            self.assertTrue(np.array_equal(a, b),
+                            'Latencies of flow {} differ'.format(flow))
@@ -0,0 +1,50 @@
+import unittest
+
+from common import SimulationTest, SLICED_FLOWS
+from scheduler.scheduler import CoreScheduler
+
+
+class CoalescingTest(SimulationTest):
+    """Waiting for several time slices at once gives the same latencies as
+    preempting the request at every slice."""
+
+    def run_sliced(self, flows, name, **options):
+        may_coalesce_slices = CoreScheduler.may_coalesce_slices
+        CoreScheduler.may_coalesce_slices = lambda self, request: False
+        try:
+            return self.run_latencies(flows, name, **options)
+        finally:
+            CoreScheduler.may_coalesce_slices = may_coalesce_slices
+
+    def assert_same_as_sliced(self, flows, **options):
+        coalesced_result, coalesced_latencies = self.run_latencies(
+            flows, 'coalesced', **options)
+        sliced_result, sliced_latencies = self.run_sliced(flows, 'sliced',
+                                                          **options)
+        self.assertEqual(coalesced_result.flows, sliced_result.flows)
+        self.assert_same_latencies(coalesced_latencies, sliced_latencies)
+
+    def test_global(self):
+        for engine in ['simpy', 'heap']:
+            self.assert_same_as_sliced(SLICED_FLOWS, host_type='global',
+                                       cores=4, engine=engine)
+
+    def test_local(self):
+        self.assert_same_as_sliced(SLICED_FLOWS, host_type='local', cores=4,
+                                   engine='heap')
+
+    def test_mixed(self):
+        self.assert_same_as_sliced(SLICED_FLOWS, host_type='mixed_global',
+                                   cores=4, engine='heap')
+
+    def test_perflow(self):
+        # The dequeue policies keep state between dequeues
+        for policy in ['FirstPacketWaitDequeuePolicy',
+                       'RoundRobinDequeuePolicy']:
+            self.assert_same_as_sliced(SLICED_FLOWS, host_type='perflow',
+                                       cores=4, engine='heap',
+                                       queue_policy=policy)
+
+
+if __name__ == '__main__':
+    unittest.main()
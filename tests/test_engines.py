@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+from common import (SimulationTest, FCFS_FLOWS, SLICED_FLOWS,
+                    NETWORK_FLOWS)
+
+
+class EngineTest(SimulationTest):
+    """The engines simulate the same requests for a seed, with the same
+    results."""
+
+    def assert_engines_agree(self, flows, **options):
+        simpy_result, simpy_latencies = self.run_latencies(
+            flows, 'simpy', engine='simpy', **options)
+        heap_result, heap_latencies = self.run_latencies(
+            flows, 'heap', engine='heap', **options)
+        self.assertEqual(simpy_result.flows, heap_result.flows)
+        self.assert_same_latencies(simpy_latencies, heap_latencies)
+
+    def test_heap_global(self):
+        self.assert_engines_agree(FCFS_FLOWS, host_type='global', cores=4)
+
+    def test_heap_time_slices(self):
+        self.assert_engines_agree(SLICED_FLOWS, host_type='global', cores=4)
+
+    def test_heap_dequeue_cost(self):
+        self.assert_engines_agree(SLICED_FLOWS, host_type='global', cores=4,
+                                  deq_cost=0.05)
+
+    def test_heap_local(self):
+        self.assert_engines_agree(SLICED_FLOWS, host_type='local', cores=4)
+
+    def test_heap_perflow(self):
+        self.assert_engines_agree(
+            SLICED_FLOWS, host_type='perflow', cores=4,
+            queue_policy='FirstPacketWaitDequeuePolicy')
+
+    def test_heap_mixed(self):
+        self.assert_engines_agree(NETWORK_FLOWS, host_type='mixed_global',
+                                  cores=4)
+
+    def test_heap_partitioned(self):
+        self.assert_engines_agree(NETWORK_FLOWS,
+                                  host_type='partitioned_global', cores=4,
+                                  network_cores=2)
+
+    def test_vector_multicore(self):
+        # Several blocks of requests per flow
+        heap_result, heap_latencies = self.run_latencies(
+            FCFS_FLOWS, 'heap', engine='heap', cores=8, sim_time=100000)
+        vector_result, vector_latencies = self.run_latencies(
+            FCFS_FLOWS, 'vector', engine='vector', cores=8, sim_time=100000)
+        self.assertEqual(heap_result.flows, vector_result.flows)
+        # The vector engine records the latencies in arrival order
+        self.assert_same_latencies([np.sort(l) for l in heap_latencies],
+                                   [np.sort(l) for l in vector_latencies])
+
+    def test_vector_single_core(self):
+        # Lindley's recursion in closed form rounds differently
+        heap_result, heap_latencies = self.run_latencies(
+            FCFS_FLOWS, 'heap', engine='heap', cores=1)
+        vector_result, vector_latencies = self.run_latencies(
+            FCFS_FLOWS, 'vector', engine='vector', cores=1)
+        self.assertTrue(np.array_equal(heap_result.field('count'),
+                                       vector_result.field('count')))
+        for heap, vector in zip(heap_latencies, vector_latencies):
+            self.assertTrue(np.allclose(np.sort(heap), np.sort(vector),
+                                        rtol=1e-9, atol=1e-9))
+
+
+if __name__ == '__main__':
+    unittest.main()
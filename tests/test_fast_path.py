@@ -0,0 +1,66 @@
+import unittest
+
+from common import (SimulationTest, FCFS_FLOWS, SLICED_FLOWS,
+                    NETWORK_FLOWS)
+import host.host
+
+
+class LockedZero(float):
+    """A free dequeue the cores don't recognize as free, which sends them
+    through the queue lock like a dequeuing cost."""
+
+    def __eq__(self, other):
+        return False
+
+    def __ne__(self, other):
+        return True
+
+
+class LockedQueue(host.host.FIFORequestQueue):
+    def __init__(self, env, size, dequeue_time, flow_config):
+        super(LockedQueue, self).__init__(env, size, LockedZero(dequeue_time),
+                                          flow_config)
+
+
+class FastPathTest(SimulationTest):
+    """Running the requests inline when dequeuing is free gives the same
+    latencies as taking the queue lock for every request."""
+
+    def run_locked(self, flows, name, **options):
+        fifo_queue = host.host.FIFORequestQueue
+        host.host.FIFORequestQueue = LockedQueue
+        try:
+            return self.run_latencies(flows, name, **options)
+        finally:
+            host.host.FIFORequestQueue = fifo_queue
+
+    def assert_same_as_locked(self, flows, **options):
+        fast_result, fast_latencies = self.run_latencies(flows, 'fast',
+                                                         **options)
+        locked_result, locked_latencies = self.run_locked(flows, 'locked',
+                                                          **options)
+        self.assertEqual(fast_result.flows, locked_result.flows)
+        self.assert_same_latencies(fast_latencies, locked_latencies)
+
+    def test_global(self):
+        for engine in ['simpy', 'heap']:
+            self.assert_same_as_locked(FCFS_FLOWS, host_type='global',
+                                       cores=4, engine=engine)
+
+    def test_global_time_slices(self):
+        # Also without coalescing, which needs a free dequeue
+        self.assert_same_as_locked(SLICED_FLOWS, host_type='global', cores=4,
+                                   engine='heap')
+
+    def test_mixed(self):
+        self.assert_same_as_locked(NETWORK_FLOWS, host_type='mixed_global',
+                                   cores=4, engine='heap')
+
+    def test_local(self):
+        for flows in [FCFS_FLOWS, SLICED_FLOWS]:
+            self.assert_same_as_locked(flows, host_type='local', cores=4,
+                                       engine='heap')
+
+
+if __name__ == '__main__':
+    unittest.main()
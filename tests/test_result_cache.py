@@ -0,0 +1,71 @@
+import logging
+import unittest
+
+from common import FCFS_FLOWS, SLICED_FLOWS
+from sim import parse_options, choose_engine
+from sweep import sweep_points, sim_args, job_key
+from util.result_cache import opts_key
+
+SEED = 3
+
+
+class CacheKeyTest(unittest.TestCase):
+    """The sweep runner looks up its runs under the key sim.py stores them
+    with."""
+
+    def setUp(self):
+        # Without the warnings of the fallbacks to the heap engine
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def assert_same_keys(self, **spec):
+        spec.setdefault('output_dir', '/tmp/sweep')
+        spec.setdefault('cores', [1, 8])
+        spec.setdefault('flows', FCFS_FLOWS)
+        spec.setdefault('loads', [[0.2, 0.2], [0.4, 0.4]])
+        points = sweep_points(spec)
+        self.assertTrue(len(points) > 0)
+        for point in points:
+            # The arguments the sweep runner sends to the sim.py workers
+            opts = parse_options(sim_args(spec, point) + ['-s', str(SEED)])
+            choose_engine(opts, point['config'])
+            self.assertEqual(job_key(spec, point, SEED),
+                             opts_key(opts, point['config']))
+
+    def test_default(self):
+        self.assert_same_keys()
+
+    def test_engines(self):
+        for engine in ['simpy', 'heap', 'vector']:
+            self.assert_same_keys(engine=engine)
+
+    def test_vector_fallback(self):
+        # Time slices, per flow queues and dequeuing costs need the heap
+        # engine
+        self.assert_same_keys(engine='vector', flows=SLICED_FLOWS)
+        self.assert_same_keys(engine='vector', host_types=['perflow'])
+        self.assert_same_keys(engine='vector', deq_costs=[0.0, 0.5])
+
+    def test_host_options(self):
+        self.assert_same_keys(host_types=['mixed_global',
+                                          'partitioned_global'],
+                              network_cores=2, sim_time=20000)
+        self.assert_same_keys(host_types=['perflow'],
+                              queue_policies=['FirstPacketWaitDequeuePolicy',
+                                              'RoundRobinDequeuePolicy'])
+
+    def test_histograms(self):
+        self.assert_same_keys(histogram_backend='log', precision=3)
+        self.assert_same_keys(precision=3)
+        self.assert_same_keys(histogram_backend='kll', sketch_size=400)
+
+    def test_warmup(self):
+        self.assert_same_keys(warmup=1000)
+        self.assert_same_keys(warmup='mser')
+        self.assert_same_keys(warmup='mser', sim_time=20000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from common import (SimulationTest, FCFS_FLOWS, SLICED_FLOWS,
+                    NETWORK_FLOWS)
+from request.trace import read_trace
+
+
+class TraceTest(SimulationTest):
+    """Replaying a recorded trace simulates the very requests of the
+    recording run."""
+
+    def record(self, flows, **options):
+        trace = self.path('trace')
+        result, latencies = self.run_latencies(flows, 'recorded',
+                                               record_trace=trace, **options)
+        return trace, result, latencies
+
+    def assert_replay_same(self, flows, **options):
+        trace, result, latencies = self.record(flows, **options)
+        replay_result, replay_latencies = self.run_latencies(
+            flows, 'replayed', replay_trace=trace, seed=None, **options)
+        self.assertEqual(result.flows, replay_result.flows)
+        self.assert_same_latencies(latencies, replay_latencies)
+
+    def test_records_every_request(self):
+        trace, result, latencies = self.record(FCFS_FLOWS, host_type='global',
+                                               cores=4, engine='heap')
+        records = read_trace(trace)
+        # Some requests are still running at the end
+        self.assertTrue(len(records) >= sum(len(l) for l in latencies))
+        self.assertTrue(np.all(np.diff(records['arrival']) >= 0))
+        for flow in range(len(FCFS_FLOWS)):
+            self.assertTrue(np.any(records['flow'] == flow))
+
+    def test_replay(self):
+        for flows in [FCFS_FLOWS, SLICED_FLOWS]:
+            self.assert_replay_same(flows, host_type='global', cores=4,
+                                    engine='heap')
+        self.assert_replay_same(NETWORK_FLOWS, host_type='mixed_global',
+                                cores=4, engine='heap')
+
+    def test_replay_engines(self):
+        trace, result, latencies = self.record(FCFS_FLOWS, host_type='global',
+                                               cores=4, engine='heap')
+        for engine in ['simpy', 'vector']:
+            replay_result, replay_latencies = self.run_latencies(
+                FCFS_FLOWS, engine, replay_trace=trace, host_type='global',
+                cores=4, engine=engine)
+            self.assertEqual(result.flows, replay_result.flows)
+            self.assert_same_latencies(
+                [np.sort(l) for l in latencies],
+                [np.sort(l) for l in replay_latencies])
+
+    def test_vector_record(self):
+        trace, result, latencies = self.record(FCFS_FLOWS, host_type='global',
+                                               cores=4, engine='vector')
+        replay_result, replay_latencies = self.run_latencies(
+            FCFS_FLOWS, 'replayed', replay_trace=trace, host_type='global',
+            cores=4, engine='heap')
+        self.assertEqual(result.flows, replay_result.flows)
+        self.assert_same_latencies(
+            [np.sort(l) for l in latencies],
+            [np.sort(l) for l in replay_latencies])
+
+    def test_other_flows(self):
+        trace, result, latencies = self.record(FCFS_FLOWS, host_type='global',
+                                               cores=4, engine='heap')
+        with self.assertRaises(ValueError):
+            self.run_latencies(FCFS_FLOWS[:1], 'replayed', replay_trace=trace,
+                               host_type='global', cores=4, engine='heap')
+
+
+if __name__ == '__main__':
+    unittest.main()